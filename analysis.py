@@ -0,0 +1,64 @@
+"""Análisis vertical y horizontal calculado con NumPy sobre un FinancialPanel.
+
+Usa las mismas definiciones que las fórmulas del reporte (report_layout.VERTICAL_SECTIONS y la
+variación respecto del año anterior) y la semántica de IFERROR(...,0). Las funciones *_analysis
+devuelven DataFrames de pandas con una fila por empresa y año y una columna por fila de BASE.xlsx.
+"""
+import numpy as np
+from panel import FinancialPanel, LINES, iferror_div, previous_year
+from report_layout import FIRST_ROW, vertical_base_row
+
+def statement_rows(key):
+    """Filas de BASE.xlsx que ocupa el estado key"""
+    lines = LINES[key]
+    return np.arange(FIRST_ROW, FIRST_ROW + lines.stop - lines.start)
+
+def vertical_values(panel, key):
+    """(empresas × años × filas del estado): cada fila sobre su fila base; NaN en las filas sin análisis
+    y en los años sin datos"""
+    block = panel.values[..., LINES[key]]
+    rows = statement_rows(key)
+    bases = np.array([vertical_base_row(key, r) or r for r in rows])
+    result = iferror_div(block, block[..., bases - FIRST_ROW])
+    analysed = bases != rows
+    return np.where(analysed & panel.present()[..., None], result, np.nan)
+
+def horizontal_values(panel, key):
+    """(empresas × años × filas del estado): variación de cada año respecto del anterior; NaN en la fila
+    del encabezado y cuando el año o su anterior no tienen datos"""
+    block = panel.values[..., LINES[key]]
+    previous, prev_present = previous_year(panel)
+    prev_block = previous[..., LINES[key]]
+    result = iferror_div(block - prev_block, prev_block)
+    analysed = statement_rows(key) > FIRST_ROW
+    return np.where(analysed & (panel.present() & prev_present)[..., None], result, np.nan)
+
+def report_analysis(entries):
+    """{clave del estado: (vertical, horizontal)} con arreglos (años × filas) en el orden de entries,
+    para los valores guardados junto a las fórmulas del reporte"""
+    panel = FinancialPanel.from_entries({None: entries})
+    order = panel.year_order(entries)
+    return {key: (vertical_values(panel, key)[0, order], horizontal_values(panel, key)[0, order]) for key in LINES}
+
+def _frame(data, key, values_fn):
+    import pandas as pd
+    if isinstance(data, FinancialPanel):
+        panel = data
+        index = pd.MultiIndex.from_product([panel.companies, panel.years], names=['company', 'year'])
+    else:
+        panel = FinancialPanel.from_entries({None: data})
+        index = pd.Index(panel.years, name='year')
+    values = values_fn(panel, key)
+    rows = statement_rows(key)
+    frame = pd.DataFrame(values.reshape(-1, len(rows)), index=index, columns=pd.Index(rows, name='row'))
+    # Solo las filas que se analizan y los años con resultado
+    return frame.dropna(axis=1, how='all').dropna(axis=0, how='all')
+
+def vertical_analysis(data, key):
+    """DataFrame del análisis vertical del estado key ('bs', 'is' o 'cf') para un FinancialPanel
+    (índice empresa, año) o los entries de una empresa (índice año)"""
+    return _frame(data, key, vertical_values)
+
+def horizontal_analysis(data, key):
+    """DataFrame del análisis horizontal del estado key; igual que vertical_analysis"""
+    return _frame(data, key, horizontal_values)
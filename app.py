@@ -1,6 +1,9 @@
 import streamlit as st
-from utils import process_files_and_generate_report, generate_ratios_charts_pdf
-import tempfile, os, shutil, re
+from smv_reader import probe_smv_file
+import os, re, threading, uuid, zipfile
+from xml.etree.ElementTree import ParseError
+from jobs import JobRejected, get_job_manager
+from session_store import get_session_store
 from style import load_styles, show_alert
 
 hide_streamlit_style = """
@@ -33,57 +36,166 @@ st.markdown("""
     </div>
 """, unsafe_allow_html=True)
 
-# Estado de sesión
+# Estado de sesión: los archivos generados van al almacén de sesiones (memoria acotada, con volcado a disco);
+# en el estado solo quedan sus nombres y los datos ya leídos
+store = get_session_store()
+sesion = st.session_state.setdefault('sesion_id', uuid.uuid4().hex)
+store.touch(sesion)
 if 'state' not in st.session_state:
     st.session_state['state'] = {
-        'temp_dir': None,
-        'report_path': None,
-        'pdf_path': None,
-        'excel_data': None,
-        'pdf_data': None,
         'excel_filename': None,
-        'pdf_filename': None
+        'pdf_filename': None,
+        'report': None
     }
 
 def clear_session_files():
-    """Limpia archivos temporales y resetea el estado"""
-    if st.session_state['state']['temp_dir'] and os.path.exists(st.session_state['state']['temp_dir']):
-        shutil.rmtree(st.session_state['state']['temp_dir'], ignore_errors=True)
+    """Resetea el estado, cancela los trabajos en curso (también el PDF anticipado) y descarta los archivos"""
+    trabajo = st.session_state.pop('trabajo', None)
+    if st.session_state.pop('pdf_anticipado', None) or trabajo:
+        get_job_manager().cancel_session(sesion)
+    store.drop(sesion)
     st.session_state['state'] = {
-        'temp_dir': None,
-        'report_path': None,
-        'pdf_path': None,
-        'excel_data': None,
-        'pdf_data': None,
         'excel_filename': None,
-        'pdf_filename': None
+        'pdf_filename': None,
+        'report': None
     }
 
+def importar_dependencias():
+    """Arranca el pool de trabajos, cuyos procesos cargan utils (openpyxl, NumPy), la plantilla,
+    matplotlib y el módulo de IA"""
+    try:
+        get_job_manager()
+    except Exception as e:
+        # El precalentamiento es opcional: los errores se verán al generar el reporte
+        print(f"⚠️ Precalentamiento incompleto: {e}")
+
+@st.cache_resource(show_spinner=False)
+def precalentar():
+    """Prepara el pool de trabajos en segundo plano, una sola vez por proceso y después de mostrar
+    la página (SMV_WARMUP=0 lo desactiva: se prepara con el primer reporte)"""
+    hilo = threading.Thread(target=importar_dependencias, name="precalentamiento", daemon=True)
+    hilo.start()
+    return hilo
+
+# PDF anticipado (SMV_SPECULATIVE_PDF=1): se encola apenas termina el Excel, sin esperar el botón
+PDF_ANTICIPADO = os.environ.get("SMV_SPECULATIVE_PDF", "0").lower() in ("1", "true", "yes")
+
+ETAPAS = {'lectura': "Leyendo los archivos", 'escritura': "Escribiendo el reporte Excel",
+          'ratios': "Calculando ratios", 'informe': "Generando el análisis con IA", 'páginas': "Dibujando el PDF"}
+
+def adjuntar_resultado(tipo, resultado):
+    """Guarda en la sesión el resultado de un trabajo terminado"""
+    if tipo == 'report':
+        store.put(sesion, 'excel', resultado['data'])
+        st.session_state['state'].update({
+            'excel_filename': resultado['filename'],
+            # Datos ya leídos para el PDF (sin volver a abrir el Excel)
+            'report': {k: resultado[k] for k in ('company', 'years', 'entries')}
+        })
+        if PDF_ANTICIPADO:
+            # Solo si hay un proceso libre: el PDF anticipado no ocupa lugar en la cola
+            try:
+                st.session_state['pdf_anticipado'] = {'id': get_job_manager().submit(
+                    'pdf', sesion, st.session_state['state']['report'], resultado['filename'], background=True)}
+            except JobRejected:
+                pass
+    else:
+        store.put(sesion, 'pdf', resultado['data'])
+        st.session_state['state'].update({'pdf_filename': resultado['filename']})
+
+def encolar(tipo, *args, **kwargs):
+    """Envía un trabajo de la sesión para seguirlo; si no se admite, deja un aviso con cuándo reintentar"""
+    try:
+        st.session_state['trabajo'] = {'id': get_job_manager().submit(tipo, sesion, *args, **kwargs)}
+    except JobRejected as e:
+        st.session_state['aviso_trabajo'] = f"{e} Vuelve a intentarlo en unos {e.retry_after} segundos."
+
+@st.fragment(run_every=1.0)
+def seguir_trabajo():
+    """Muestra el avance del trabajo de la sesión y, al terminar, adjunta el resultado y recarga la página"""
+    trabajo = st.session_state.get('trabajo')
+    if not trabajo:
+        return
+    jobs = get_job_manager()
+    info = jobs.status(trabajo['id'])
+    if info is None:
+        st.session_state.pop('trabajo', None)
+        st.rerun()
+    if info['state'] == 'queued' and info.get('position'):
+        cancelados = (f", {info['cancelling']} trabajo(s) cancelado(s) liberando su proceso"
+                      if info.get('cancelling') else "")
+        st.progress(0.0, text=f"⏳ En cola (posición {info['position']}{cancelados})...")
+    elif info['state'] == 'queued':
+        st.progress(0.0, text="⏳ Iniciando...")
+    elif info['state'] == 'running':
+        st.progress(info['progress'], text=f"⏳ {ETAPAS.get(info['stage'], 'Iniciando')}...")
+    elif info['state'] == 'done':
+        adjuntar_resultado(info['kind'], jobs.result(trabajo['id']))
+        st.session_state.pop('trabajo', None)
+        st.rerun()
+    else:
+        st.session_state.pop('trabajo', None)
+        st.session_state['error_trabajo'] = info
+        st.rerun()
+
+def recoger_pdf_anticipado():
+    """Si el PDF anticipado ya terminó, lo guarda en la sesión (listo para mostrarlo al pedirlo)"""
+    anticipado = st.session_state.get('pdf_anticipado')
+    if not anticipado or anticipado.get('filename'):
+        return
+    jobs = get_job_manager()
+    info = jobs.status(anticipado['id'])
+    if info is None or info['state'] in ('error', 'cancelled'):
+        # Sin resultado: el PDF se generará al pedirlo
+        st.session_state.pop('pdf_anticipado', None)
+    elif info['state'] == 'done':
+        pdf = jobs.result(anticipado['id'])
+        store.put(sesion, 'pdf', pdf['data'])
+        anticipado['filename'] = pdf['filename']
+
+def sondear_archivo(f):
+    """Lee empresa y año del libro sin cargarlo completo (memorizado por archivo subido)"""
+    cache = st.session_state.setdefault('sondeos', {})
+    key = (getattr(f, 'file_id', None) or f.name, f.size)
+    if key not in cache:
+        try:
+            cache[key] = probe_smv_file(f)
+        finally:
+            f.seek(0)
+    return cache[key]
+
 def validar_archivos(archivos):
-    """Valida que los archivos sean consecutivos en años"""
+    """Valida que los archivos sean consecutivos en años leyendo el año dentro de cada libro"""
     if not all(f.name.endswith('.xlsx') for f in archivos):
         return False, "Todos los archivos deben ser en formato .xlsx", "error", []
     
-    try:
-        anios = []
-        archivos_con_anio = []
-        for f in archivos:
-            match = re.search(r'(\d{4})', f.name)
-            if not match:
-                return False, "Los nombres de los archivos deben contener un año válido (ejemplo: Leche_Gloria_2024.xlsx).", "warning", []
-            anio = int(match.group(1))
-            anios.append(anio)
-            archivos_con_anio.append((anio, f))
+    if len(archivos) < 3:
+        return False, "Debes subir al menos 3 archivos.", "warning", []
+    
+    archivos_con_anio, empresas = [], set()
+    for f in archivos:
+        try:
+            sondeo = sondear_archivo(f)
+        except (zipfile.BadZipFile, KeyError, ValueError, ParseError) as e:
+            return False, f"No se pudo leer el archivo {f.name}: {e}", "error", []
         
-        if len(anios) < 3:
-            return False, "Debes subir al menos 3 archivos.", "warning", []
-    except ValueError:
-        return False, "Los nombres de los archivos deben contener un año válido.", "error", []
+        # Si el nombre del archivo indica un año, debe coincidir con el del libro
+        match = re.search(r'(?<!\d)(20\d{2})(?!\d)', f.name)
+        if match and int(match.group(1)) != sondeo['year']:
+            return False, f"El archivo {f.name} indica el año {match.group(1)} pero contiene datos de {sondeo['year']}.", "warning", []
+        archivos_con_anio.append((sondeo['year'], f))
+        empresas.add(sondeo['company'])
+    
+    if len(empresas) > 1:
+        return False, f"Los archivos pertenecen a distintas empresas: {', '.join(sorted(empresas))}", "warning", []
     
     # Ordenar por año descendente
     archivos_ordenados = sorted(archivos_con_anio, key=lambda x: x[0], reverse=True)
     anios_ordenados = [a for a, _ in archivos_ordenados]
     
+    if len(set(anios_ordenados)) != len(anios_ordenados):
+        return False, f"Hay años repetidos entre los archivos: {', '.join(map(str, anios_ordenados))}", "warning", []
+    
     # Verificar que sean consecutivos
     consecutivos = all(anios_ordenados[i] - anios_ordenados[i + 1] == 1 for i in range(len(anios_ordenados) - 1))
     
@@ -115,50 +227,31 @@ if uploaded:
     else:
         show_alert(mensaje, "success")
         
-        # Botón para generar Excel
-        if st.button("🚀 Generar Reporte Completo (Excel)", type="primary"):
+        # Botón para generar Excel (se ejecuta en segundo plano; el avance se muestra abajo)
+        trabajo = st.session_state.get('trabajo')
+        if st.button("🚀 Generar Reporte Completo (Excel)", type="primary", disabled=bool(trabajo)):
             clear_session_files()
-            
-            with st.spinner("⏳ Procesando archivos y generando reporte Excel..."):
-                try:
-                    tmpdir = tempfile.mkdtemp()
-                    paths = []
-                    
-                    # Guardar archivos temporalmente
-                    for f in archivos_ordenados:
-                        p = os.path.join(tmpdir, f.name)
-                        with open(p, "wb") as out:
-                            out.write(f.getbuffer())
-                        paths.append(p)
-                    
-                    # Generar reporte
-                    out_path = process_files_and_generate_report(
-                        paths,
-                        model_path="BASE.xlsx",
-                        output_dir=tmpdir
-                    )
-                    
-                    # Guardar en sesión
-                    with open(out_path, "rb") as fh:
-                        st.session_state['state']['excel_data'] = fh.read()
-                    
-                    st.session_state['state'].update({
-                        'temp_dir': tmpdir,
-                        'report_path': out_path,
-                        'excel_filename': os.path.basename(out_path)
-                    })
-                    
-                    st.success("✅ Reporte Excel generado exitosamente. Puedes descargarlo a continuación.")
-                    st.rerun()
-                    
-                except Exception as e:
-                    st.error(f"❌ Error al generar el reporte: {str(e)}")
-                    import traceback
-                    st.code(traceback.format_exc())
-                    clear_session_files()
-        
-        # Sección de descargas
-        if st.session_state['state']['excel_data']:
+            encolar('report', [f.getvalue() for f in archivos_ordenados], model_path="BASE.xlsx")
+            st.rerun()
+
+        if (error := st.session_state.pop('error_trabajo', None)):
+            etapa = "el reporte" if error['kind'] == 'report' else "el PDF"
+            st.error(f"❌ Error al generar {etapa}: {error['error']}")
+            if error.get('traceback'):
+                st.code(error['traceback'])
+        if (aviso := st.session_state.pop('aviso_trabajo', None)):
+            st.warning(f"⏳ {aviso}")
+        if trabajo:
+            seguir_trabajo()
+
+        recoger_pdf_anticipado()
+
+        # Sección de descargas (los archivos descartados por inactividad se vuelven a generar)
+        excel_data = store.get(sesion, 'excel') if st.session_state['state']['excel_filename'] else None
+        pdf_data = store.get(sesion, 'pdf') if st.session_state['state']['pdf_filename'] else None
+        if st.session_state['state']['excel_filename'] and excel_data is None:
+            clear_session_files()
+        if excel_data is not None:
             st.markdown("---")
             st.subheader("📥 Descargar Resultados")
             
@@ -168,7 +261,7 @@ if uploaded:
             with col1:
                 st.download_button(
                     label=f"⬇️ Descargar Reporte Excel",
-                    data=st.session_state['state']['excel_data'],
+                    data=excel_data,
                     file_name=st.session_state['state']['excel_filename'],
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                     help="Reporte con Análisis Vertical, Horizontal y Ratios",
@@ -177,54 +270,30 @@ if uploaded:
             
             # Columna 2: Generar/Descargar PDF
             with col2:
-                if st.session_state['state']['pdf_data']:
+                if pdf_data is not None:
                     st.download_button(
                         label=f"⬇️ Descargar Análisis PDF",
-                        data=st.session_state['state']['pdf_data'],
+                        data=pdf_data,
                         file_name=st.session_state['state']['pdf_filename'],
                         mime="application/pdf",
                         help="PDF con gráficos de ratios y análisis narrativo",
                         use_container_width=True
                     )
                 else:
-                    if st.button("📊 Generar Análisis PDF", type="secondary", use_container_width=True):
-                        with st.spinner("⏳ Generando PDF con gráficos y análisis con IA..."):
-                            try:
-                                report_path = st.session_state['state']['report_path']
-                                
-                                # Verificar que el archivo existe
-                                if not os.path.exists(report_path):
-                                    # Recrear desde datos en memoria
-                                    report_path = os.path.join(
-                                        st.session_state['state']['temp_dir'],
-                                        st.session_state['state']['excel_filename']
-                                    )
-                                    with open(report_path, "wb") as fh:
-                                        fh.write(st.session_state['state']['excel_data'])
-                                    st.session_state['state']['report_path'] = report_path
-                                
-                                # Generar PDF
-                                pdf_path = generate_ratios_charts_pdf(
-                                    report_path,
-                                    st.session_state['state']['temp_dir']
-                                )
-                                
-                                # Guardar en sesión
-                                with open(pdf_path, "rb") as fh_pdf:
-                                    st.session_state['state']['pdf_data'] = fh_pdf.read()
-                                
-                                st.session_state['state'].update({
-                                    'pdf_path': pdf_path,
-                                    'pdf_filename': os.path.basename(pdf_path)
-                                })
-                                
-                                st.success("✅ Análisis PDF generado exitosamente.")
-                                st.rerun()
-                                
-                            except Exception as e:
-                                st.error(f"❌ Error al generar PDF: {str(e)}")
-                                import traceback
-                                st.code(traceback.format_exc())
+                    if st.button("📊 Generar Análisis PDF", type="secondary", use_container_width=True,
+                                 disabled=bool(trabajo)):
+                        anticipado = st.session_state.pop('pdf_anticipado', None)
+                        if anticipado and anticipado.get('filename'):
+                            # El PDF anticipado ya está listo
+                            st.session_state['state']['pdf_filename'] = anticipado['filename']
+                        elif anticipado:
+                            # Todavía se está generando: se sigue su avance
+                            st.session_state['trabajo'] = {'id': anticipado['id']}
+                        else:
+                            # PDF desde los datos ya leídos (o desde el Excel si no están), en segundo plano
+                            state = st.session_state['state']
+                            encolar('pdf', state['report'] or excel_data, state['excel_filename'])
+                        st.rerun()
             
             # Columna 3: Nuevo análisis
             with col3:
@@ -236,3 +305,6 @@ else:
     clear_session_files()
     st.write("👆 Aún no has subido archivos. Por favor, selecciona los archivos Excel para comenzar el análisis.")
 
+# Las dependencias pesadas se cargan después de dibujar la página
+if os.environ.get("SMV_WARMUP", "1") != "0":
+    precalentar()
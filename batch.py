@@ -0,0 +1,137 @@
+"""Procesamiento por lotes sin Streamlit: un reporte (y opcionalmente su PDF) por carpeta de empresa.
+
+Uso: python batch.py CARPETA_RAIZ --output SALIDA [--pdf] [--parquet] [--workers N]
+
+Cada carpeta bajo CARPETA_RAIZ que contenga archivos .xlsx es una empresa. El avance se guarda en
+SALIDA/manifest.json después de cada empresa; al volver a ejecutar se omiten las empresas ya
+procesadas cuyos archivos no cambiaron, de modo que un lote interrumpido continúa donde quedó.
+"""
+import argparse, json, multiprocessing, os, sys, tempfile, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from cache import sha256_of
+
+MANIFEST = "manifest.json"
+
+def find_companies(root):
+    """{carpeta relativa: [archivos .xlsx ordenados]} de cada carpeta con libros SMV"""
+    companies = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        files = sorted(f for f in filenames if f.lower().endswith(".xlsx") and not f.startswith("~$"))
+        if files:
+            companies[os.path.relpath(dirpath, root)] = [os.path.join(dirpath, f) for f in files]
+    return companies
+
+def fingerprint(files):
+    return {os.path.basename(f): sha256_of(f) for f in files}
+
+def load_manifest(path):
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+def save_manifest(path, manifest):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+def process_company(files, output_dir, options):
+    """Tarea de un proceso del pool: genera el reporte (y el PDF y las tablas Parquet) de una empresa.
+    Cada salida se anota en el resultado apenas se escribe, también si un paso posterior falla
+    (status 'error'), para que al reprocesar la empresa se reemplace en vez de duplicarse."""
+    from utils import generate_report, generate_pdf, save_report, save_pdf
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    result = {}
+    try:
+        # Cada empresa se lee de forma secuencial: el paralelismo está entre empresas
+        report = generate_report(files, options['model'], engine=options['engine'], workers=1,
+                                 backend=options['backend'], compact=options['compact'])
+        result['report'] = save_report(report, output_dir)
+        if options['pdf']:
+            result['pdf'] = save_pdf(generate_pdf(report, workers=1), output_dir)
+        if options['parquet']:
+            from export import export_parquet
+            export_parquet(report, options['parquet'])
+            result['parquet'] = True
+        result['status'] = 'ok'
+    except Exception as e:
+        result.update(status='error', error=f"{type(e).__name__}: {e}")
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+def main(argv=None):
+    from utils import BACKENDS, ENGINES
+    parser = argparse.ArgumentParser(description="Genera los reportes de todas las empresas de una carpeta.")
+    parser.add_argument("root", help="carpeta con una subcarpeta de archivos SMV por empresa")
+    parser.add_argument("--output", "-o", required=True, help="carpeta de salida (se crea si no existe)")
+    parser.add_argument("--pdf", action="store_true", help="genera también el PDF de cada empresa")
+    parser.add_argument("--parquet", action="store_true", help="exporta estados, análisis y ratios a SALIDA/parquet")
+    parser.add_argument("--workers", "-w", type=int, default=os.cpu_count() or 1, help="empresas en paralelo")
+    parser.add_argument("--model", default="BASE.xlsx", help="plantilla del reporte")
+    parser.add_argument("--engine", choices=list(ENGINES), help="motor de lectura (SMV_ENGINE por defecto)")
+    parser.add_argument("--backend", choices=list(BACKENDS), help="backend de escritura")
+    parser.add_argument("--compact", action="store_true", default=None, help="fórmulas compartidas")
+    parser.add_argument("--force", action="store_true", help="reprocesa también las empresas ya completadas")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output, exist_ok=True)
+    manifest_path = os.path.join(args.output, MANIFEST)
+    manifest = load_manifest(manifest_path)
+    companies = find_companies(args.root)
+    options = {'model': os.path.abspath(args.model), 'engine': args.engine, 'backend': args.backend,
+               'compact': args.compact, 'pdf': args.pdf,
+               'parquet': os.path.abspath(os.path.join(args.output, "parquet")) if args.parquet else None}
+
+    pending, skipped = {}, 0
+    for name, files in companies.items():
+        prints = fingerprint(files)
+        done = manifest.get(name, {})
+        if (not args.force and done.get('status') == 'ok' and done.get('inputs') == prints
+                and (done.get('pdf') or not args.pdf) and (done.get('parquet') or not args.parquet)):
+            skipped += 1
+            continue
+        # Las salidas anteriores de una empresa que se reprocesa se reemplazan
+        for key in ('report', 'pdf'):
+            if done.get(key) and os.path.exists(done[key]):
+                os.remove(done[key])
+        pending[name] = (files, prints)
+    print(f"📁 {len(companies)} empresas: {len(pending)} por procesar, {skipped} ya completadas")
+
+    start, ok, failed, n_files = time.perf_counter(), 0, 0, 0
+    if pending:
+        with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(pending))),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {pool.submit(process_company, files, os.path.join(args.output, name), options): name
+                       for name, (files, _) in pending.items()}
+            for future in as_completed(futures):
+                name = futures[future]
+                files, prints = pending[name]
+                entry = {'inputs': prints, 'finished': time.strftime("%Y-%m-%dT%H:%M:%S")}
+                try:
+                    entry.update(future.result())
+                except Exception as e:
+                    # El proceso no llegó a devolver resultado (p. ej. murió)
+                    entry.update(status='error', error=f"{type(e).__name__}: {e}")
+                if entry['status'] == 'ok':
+                    ok += 1
+                    n_files += len(files)
+                    print(f"✅ {name}: {os.path.basename(entry['report'])} ({entry['seconds']} s)")
+                else:
+                    failed += 1
+                    print(f"❌ {name}: {entry['error']}")
+                manifest[name] = entry
+                save_manifest(manifest_path, manifest)
+
+    elapsed = time.perf_counter() - start
+    print(f"📊 {ok} correctas, {failed} con error, {skipped} omitidas en {elapsed:.1f} s")
+    if ok and elapsed > 0:
+        print(f"   {ok / elapsed * 60:.1f} empresas/min, {n_files / elapsed:.1f} archivos/s")
+    print(f"📝 Manifiesto: {manifest_path}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
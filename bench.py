@@ -0,0 +1,89 @@
+"""Comparación de tiempo y tamaño del reporte por backend y modo de fórmulas.
+
+Uso: python bench.py CARPETA_CON_ARCHIVOS_SMV [--repeat 5]
+     python bench.py --imports    tiempos de importación en un proceso nuevo y presupuesto de arranque
+"""
+import argparse, glob, io, os, subprocess, sys, time, zipfile
+
+# Lo que app.py importa antes de dibujar la página (además de streamlit) debe cargar en IMPORT_BUDGET_MS
+# y sin ninguna de las dependencias pesadas, que se cargan en la primera generación o al precalentar
+FIRST_PAINT_MODULES = ["smv_reader", "session_store", "jobs"]
+HEAVY_MODULES = ["openpyxl", "numpy", "matplotlib", "xlsxwriter", "pyarrow", "google.genai"]
+IMPORT_BUDGET_MS = 50
+STAGE_MODULES = {'primera pantalla': FIRST_PAINT_MODULES, 'reporte Excel': ["utils"],
+                 'PDF': ["utils", "pdf_pages", "peers", "informe_ia"]}
+
+def sheet_xml_bytes(data):
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        return sum(i.file_size for i in zf.infolist() if i.filename.startswith("xl/worksheets/"))
+
+def best_time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t)
+    return min(times), result
+
+def import_time(modules, repeat):
+    """Mejor tiempo (ms) de importar modules en un proceso nuevo, descontando el arranque del intérprete,
+    y las dependencias pesadas que quedaron cargadas"""
+    code = ("import sys, time; t = time.perf_counter(); import " + ", ".join(modules) +
+            "; print((time.perf_counter() - t) * 1000); print(','.join(m for m in %r if m in sys.modules))"
+            % HEAVY_MODULES)
+    best, heavy = None, []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout.splitlines()
+        ms = float(out[-2])
+        best, heavy = min(ms, best or ms), [m for m in out[-1].split(",") if m]
+    return best, heavy
+
+def bench_imports(repeat):
+    """Muestra el tiempo de importación de cada etapa; devuelve 1 si la primera pantalla excede el presupuesto"""
+    print(f"{'etapa':<17} {'importar (ms)':>13}  dependencias pesadas")
+    for stage, modules in STAGE_MODULES.items():
+        try:
+            ms, heavy = import_time(modules, repeat)
+        except subprocess.CalledProcessError as e:
+            print(f"{stage:<17} {'error':>13}  {(e.stderr.strip().splitlines() or [''])[-1]}")
+            ms, heavy = float('inf'), []
+        else:
+            print(f"{stage:<17} {ms:>13.1f}  {', '.join(heavy) or '-'}")
+        if modules is FIRST_PAINT_MODULES:
+            ok = ms <= IMPORT_BUDGET_MS and not heavy
+            first = (ms, heavy)
+    print(f"{'✅' if ok else '❌'} primera pantalla: {first[0]:.1f} ms (presupuesto {IMPORT_BUDGET_MS} ms)"
+          + (f", carga {', '.join(first[1])}" if first[1] else ""))
+    return 0 if ok else 1
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("carpeta", nargs="?")
+    parser.add_argument("--model", default="BASE.xlsx")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--imports", action="store_true", help="mide los tiempos de importación y el presupuesto")
+    args = parser.parse_args()
+    if args.imports:
+        return bench_imports(args.repeat)
+    if not args.carpeta:
+        parser.error("indica la carpeta con archivos SMV o --imports")
+
+    import openpyxl
+    from utils import BACKENDS, generate_report
+    files = sorted(glob.glob(os.path.join(args.carpeta, "*.xlsx")))
+    # Lectura en caché para medir solo la escritura; sin la caché de reportes ni el almacén local
+    run = lambda **kwargs: generate_report(files, args.model, store=False, artifact_cache=False, **kwargs)
+    run()
+    print(f"{len(files)} archivos, mejor de {args.repeat}")
+    print(f"{'backend':<11} {'fórmulas':<10} {'generar (s)':>11} {'xlsx (KB)':>10} {'XML hojas (KB)':>15} {'abrir (s)':>10}")
+    for backend in BACKENDS:
+        for compact in (False, True):
+            gen, report = best_time(lambda: run(backend=backend, compact=compact), args.repeat)
+            data = report['data']
+            load, _ = best_time(lambda: openpyxl.load_workbook(io.BytesIO(data)), args.repeat)
+            print(f"{backend:<11} {'compartidas' if compact else 'completas':<10} {gen:>11.3f} {len(data) / 1024:>10.1f} "
+                  f"{sheet_xml_bytes(data) / 1024:>15.1f} {load:>10.3f}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Caché en disco con claves por contenido (SHA-256) y evicción LRU por tamaño total.
+
+Cada entrada es un archivo independiente que se escribe de forma atómica, de modo que
+varios procesos pueden compartir el mismo directorio.
+"""
+import hashlib, json, os, tempfile, time
+
+CACHE_DIR = os.environ.get("SMV_CACHE_DIR", os.path.join(tempfile.gettempdir(), "smv_cache"))
+
+def sha256_of(source):
+    """Hash del contenido de una ruta, bytes o archivo abierto (se restaura la posición)"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as fh:
+            return hashlib.file_digest(fh, "sha256").hexdigest()
+    pos = source.tell()
+    source.seek(0)
+    try:
+        return hashlib.file_digest(source, "sha256").hexdigest()
+    finally:
+        source.seek(pos)
+
+def sha256_key(*parts):
+    """Clave SHA-256 de varias partes (textos, números o listas de ellos) en orden"""
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+class DiskCache:
+    """Valores JSON en disco; la fecha de modificación marca el último uso (LRU). Con ttl (segundos),
+    las entradas sin usar durante más de ttl se descartan."""
+    SUFFIX = ".json"
+
+    def __init__(self, directory, max_bytes, ttl=None):
+        self.directory, self.max_bytes, self.ttl = directory, max_bytes, ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}{self.SUFFIX}")
+
+    def _load(self, fh):
+        return json.load(fh)
+
+    def _dump(self, value, fh):
+        fh.write(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if self.ttl and time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, "rb") as fh:
+                value = self._load(fh)
+            os.utime(path)
+            return value
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def put(self, key, value):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                self._dump(value, fh)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp): os.remove(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Elimina las entradas vencidas y luego las menos usadas hasta respetar max_bytes"""
+        files, expired = [], time.time() - self.ttl if self.ttl else None
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.name.endswith(self.SUFFIX):
+                    st = entry.stat()
+                    files.append((st.st_mtime, st.st_size, entry.path))
+            except FileNotFoundError:
+                continue
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in sorted(files):
+            if total <= self.max_bytes and (expired is None or mtime >= expired):
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+class ArtifactCache(DiskCache):
+    """Artefactos terminados: texto (el informe) o un dict con los bytes del xlsx o del PDF en 'data'.
+    Cada archivo es una línea JSON con el tipo y los demás campos seguida de los bytes tal cual, de modo
+    que leer una entrada (el directorio puede ser compartido) nunca ejecuta código."""
+    SUFFIX = ".artifact"
+
+    def _load(self, fh):
+        meta = json.loads(fh.readline())
+        body = fh.read()
+        if meta['type'] == 'text':
+            return body.decode("utf-8")
+        return dict(meta['fields'], data=body)
+
+    def _dump(self, value, fh):
+        if isinstance(value, str):
+            meta, body = {'type': 'text'}, value.encode("utf-8")
+        else:
+            meta, body = {'type': 'bytes', 'fields': {k: v for k, v in value.items() if k != 'data'}}, value['data']
+        # json.dumps no deja saltos de línea sin escapar: la primera línea es siempre el encabezado
+        fh.write(json.dumps(meta, ensure_ascii=False).encode("utf-8") + b"\n")
+        fh.write(body)
@@ -0,0 +1,108 @@
+"""Exportación columnar (Parquet) de estados, análisis vertical/horizontal y ratios.
+
+Cada tabla es un dataset particionado por empresa y año (estilo Hive: tabla/company=.../year=.../),
+con un esquema fijo para que los lotes sucesivos se puedan leer juntos:
+
+    statements  company, year, statement, row, value
+    analysis    company, year, statement, row, vertical, horizontal
+    ratios      company, year, ratio, name, value
+
+statement es 'bs', 'is' o 'cf' y row la fila de BASE.xlsx; ratio es la fila de la hoja RATIOS.
+Las celdas con texto y los análisis que no aplican quedan nulos.
+"""
+import os
+import numpy as np
+from analysis import horizontal_values, statement_rows, vertical_values
+from panel import FinancialPanel, LINES
+from ratios import RATIOS, evaluate
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    PARQUET_DISPONIBLE = True
+except ImportError:
+    PARQUET_DISPONIBLE = False
+    print("⚠️ pyarrow no está instalado. La exportación a Parquet no estará disponible.")
+
+if PARQUET_DISPONIBLE:
+    PARTITION = pa.schema([('company', pa.string()), ('year', pa.int32())])
+    SCHEMAS = {
+        'statements': pa.schema([('statement', pa.string()), ('row', pa.int16()), ('value', pa.float64())]),
+        'analysis': pa.schema([('statement', pa.string()), ('row', pa.int16()), ('vertical', pa.float64()),
+                               ('horizontal', pa.float64())]),
+        'ratios': pa.schema([('ratio', pa.int16()), ('name', pa.string()), ('value', pa.float64())]),
+    }
+
+def _as_panel(data):
+    """FinancialPanel tal cual o a partir del resultado de generate_report"""
+    if isinstance(data, FinancialPanel):
+        return data
+    return FinancialPanel.from_entries({data['company']: data['entries']})
+
+def _column(values):
+    """Columna float64 con NaN como nulo"""
+    return pa.array(values, pa.float64(), mask=np.isnan(values))
+
+def _table(name, columns):
+    """Tabla con el esquema fijo de name a partir de columnas de NumPy"""
+    schema = pa.unify_schemas([PARTITION, SCHEMAS[name]])
+    return pa.table([_column(columns[f.name]) if f.type == pa.float64() else pa.array(columns[f.name], f.type)
+                     for f in schema], schema=schema)
+
+def _long(panel, key, arrays, keep=None):
+    """Columnas en formato largo (empresa, año, fila del estado) de arreglos (empresas × años × filas);
+    keep filtra las filas resultantes"""
+    c_idx, y_idx = np.nonzero(panel.present())
+    rows = statement_rows(key)
+    columns = {'company': np.repeat(np.array(panel.companies, dtype=object)[c_idx], len(rows)),
+               'year': np.repeat(np.array(panel.years)[y_idx], len(rows)),
+               'statement': np.full(len(c_idx) * len(rows), key, dtype=object),
+               'row': np.tile(rows, len(c_idx))}
+    columns.update({col: values[c_idx, y_idx].ravel() for col, values in arrays.items()})
+    if keep is not None:
+        mask = keep(columns)
+        columns = {col: values[mask] for col, values in columns.items()}
+    return columns
+
+def _tables(panel):
+    statements, analysis = [], []
+    for key in LINES:
+        statements.append(_table('statements', _long(panel, key, {'value': panel.statement(key)})))
+        # Del análisis solo las filas con algún resultado
+        analysis.append(_table('analysis', _long(
+            panel, key, {'vertical': vertical_values(panel, key), 'horizontal': horizontal_values(panel, key)},
+            keep=lambda cols: ~(np.isnan(cols['vertical']) & np.isnan(cols['horizontal'])))))
+
+    c_idx, y_idx = np.nonzero(panel.present())
+    results, n = evaluate(panel), len(RATIOS)
+    ratios = _table('ratios', {
+        'company': np.repeat(np.array(panel.companies, dtype=object)[c_idx], n),
+        'year': np.repeat(np.array(panel.years)[y_idx], n),
+        'ratio': np.tile([r['row'] for r in RATIOS], len(c_idx)),
+        'name': np.tile(np.array([r['name'] for r in RATIOS], dtype=object), len(c_idx)),
+        'value': np.stack([results[r['row']][c_idx, y_idx] for r in RATIOS], axis=1).ravel(),
+    })
+    return {'statements': pa.concat_tables(statements), 'analysis': pa.concat_tables(analysis), 'ratios': ratios}
+
+def export_parquet(data, output_dir):
+    """Escribe las tablas de un FinancialPanel o de un reporte (resultado de generate_report) en
+    output_dir/<tabla>/company=.../year=.../; las particiones que se vuelven a exportar se reemplazan.
+    Devuelve {tabla: carpeta}."""
+    if not PARQUET_DISPONIBLE:
+        raise RuntimeError("pyarrow no está instalado. Instalalo con: pip install pyarrow")
+    panel = _as_panel(data)
+    partitioning = ds.partitioning(PARTITION, flavor="hive")
+    paths = {}
+    for name, table in _tables(panel).items():
+        paths[name] = os.path.join(output_dir, name)
+        ds.write_dataset(table, paths[name], format="parquet", partitioning=partitioning,
+                         existing_data_behavior="delete_matching", basename_template="part-{i}.parquet")
+    return paths
+
+def read_parquet(output_dir, name, filter=None):
+    """Tabla de pyarrow con las particiones de output_dir/<name> (filter: expresión de pyarrow.dataset,
+    p. ej. ds.field('year') == 2023, que se aplica sobre las particiones sin leer los demás archivos)"""
+    schema = pa.unify_schemas([PARTITION, SCHEMAS[name]])
+    dataset = ds.dataset(os.path.join(output_dir, name), schema=schema, format="parquet",
+                         partitioning=ds.partitioning(PARTITION, flavor="hive"))
+    return dataset.to_table(filter=filter)
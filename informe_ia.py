@@ -1,6 +1,7 @@
-import textwrap
-import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+from paginator import draw_page, paginate
 import os
 
 try:
@@ -212,71 +213,34 @@ def generar_informe_local(years, all_ratios):
         return f"Error al generar el análisis financiero: {str(e)}"
 
 
+_ESTILOS_INFORME = {
+    'heading': {'x': 0.1, 'family': 'serif', 'fontsize': 11, 'fontweight': 'bold'},
+    'bullet': {'x': 0.12, 'family': 'serif', 'fontsize': 10},
+    'body': {'x': 0.1, 'family': 'serif', 'fontsize': 10},
+}
+
+def _estilo_linea(linea):
+    if linea.endswith(':') or linea.isupper():
+        return 'heading'
+    return 'bullet' if linea.startswith('•') else 'body'
+
 def exportar_informe_pdf(informe_texto, output_dir="."):
     out_file = os.path.join(output_dir, "INFORME_DETALLADO_RATIOS.pdf")
+    line_height, y_inicial, y_siguientes, y_final = 0.025, 0.88, 0.95, 0.05
+    # Las páginas se calculan una sola vez; cada bloque de líneas con el mismo estilo es un solo texto
+    paginas = paginate(informe_texto, 80, int((y_siguientes - y_final) / line_height) + 1, _estilo_linea,
+                       first_page_lines=int((y_inicial - y_final) / line_height) + 1)
 
     with PdfPages(out_file) as pdf:
-        plt.rcParams.update({'font.size': 10, 'font.family': 'serif'})
-        
-        fig = plt.figure(figsize=(8.27, 11.69))  # A4 vertical
-        
-        fig.text(0.5, 0.95, "INFORME DE ANÁLISIS FINANCIERO", 
-                ha='center', va='top', fontsize=16, fontweight='bold')
-        
-        fig.text(0.5, 0.92, "Análisis Detallado de Ratios Financieros", 
-                ha='center', va='top', fontsize=12, style='italic')
-        
-        lineas = informe_texto.split('\n')
-        y_position = 0.88
-        line_height = 0.025
-        
-        for linea in lineas:
-            # Si la línea es muy larga, dividirla
-            if len(linea) > 80:
-                sub_lineas = textwrap.wrap(linea, 80)
-                for sub_linea in sub_lineas:
-                    # Verificar si necesitamos nueva página
-                    if y_position < 0.05:
-                        pdf.savefig(fig, bbox_inches='tight')
-                        plt.close(fig)
-                        fig = plt.figure(figsize=(8.27, 11.69))
-                        y_position = 0.95
-                    
-                    # Aplicar formato según el contenido
-                    if sub_linea.strip().endswith(':') or sub_linea.strip().isupper():
-                        fig.text(0.1, y_position, sub_linea, ha='left', va='top', 
-                                fontweight='bold', fontsize=11)
-                    elif sub_linea.strip().startswith('•'):
-                        fig.text(0.12, y_position, sub_linea, ha='left', va='top', 
-                                fontsize=10)
-                    else:
-                        fig.text(0.1, y_position, sub_linea, ha='left', va='top', 
-                                fontsize=10)
-                    
-                    y_position -= line_height
-            else:
-                # Verificar si necesitamos nueva página
-                if y_position < 0.05:
-                    pdf.savefig(fig, bbox_inches='tight')
-                    plt.close(fig)
-                    fig = plt.figure(figsize=(8.27, 11.69))
-                    y_position = 0.95
-                
-                # Aplicar formato según el contenido
-                if linea.strip().endswith(':') or linea.strip().isupper():
-                    fig.text(0.1, y_position, linea, ha='left', va='top', 
-                            fontweight='bold', fontsize=11)
-                elif linea.strip().startswith('•'):
-                    fig.text(0.12, y_position, linea, ha='left', va='top', 
-                            fontsize=10)
-                else:
-                    fig.text(0.1, y_position, linea, ha='left', va='top', 
-                            fontsize=10)
-                
-                y_position -= line_height
-        
-        # Guardar la última página
-        pdf.savefig(fig, bbox_inches='tight')
-        plt.close(fig)
+        for i, bloques in enumerate(paginas):
+            fig = Figure(figsize=(8.27, 11.69))  # A4 vertical
+            FigureCanvasAgg(fig)
+            if i == 0:
+                fig.text(0.5, 0.95, "INFORME DE ANÁLISIS FINANCIERO",
+                        ha='center', va='top', family='serif', fontsize=16, fontweight='bold')
+                fig.text(0.5, 0.92, "Análisis Detallado de Ratios Financieros",
+                        ha='center', va='top', family='serif', fontsize=12, style='italic')
+            draw_page(fig, bloques, y_inicial if i == 0 else y_siguientes, line_height, _ESTILOS_INFORME)
+            pdf.savefig(fig, bbox_inches='tight')
 
     return out_file
\ No newline at end of file
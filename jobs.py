@@ -0,0 +1,255 @@
+"""Ejecución en segundo plano de los reportes y PDF de la app.
+
+Los trabajos se ejecutan en un pool de procesos (SMV_JOB_WORKERS) que se prepara al crearse: cada
+proceso importa utils (openpyxl, NumPy), matplotlib y el módulo de IA y carga BASE.xlsx antes de recibir
+trabajos. El gestor pasa al pool un trabajo por proceso libre; los demás esperan en su propia cola, de a
+lo sumo SMV_MAX_QUEUED, y submit rechaza al instante (JobRejected, con un tiempo sugerido para
+reintentar) lo que no cabe o supera SMV_SESSION_MAX_JOBS de la sesión. submit devuelve el id del
+trabajo; status informa el estado y la etapa en curso, que los procesos envían por una cola a un hilo
+de este proceso, y el resultado queda en el trabajo al terminar. Cancelar un trabajo en ejecución lo
+detiene al empezar su siguiente etapa (una llamada a Gemini ya iniciada termina); el janitor de
+session_store cancela los trabajos de las sesiones que vencen.
+
+    estado: 'queued' -> 'running' -> 'done' | 'error' | 'cancelled'
+"""
+import math, os, threading, time, traceback, uuid
+from collections import deque
+
+JOB_WORKERS = int(os.environ.get("SMV_JOB_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+JOB_TTL_MIN = float(os.environ.get("SMV_JOB_TTL_MIN", "60"))
+# Admisión: trabajos esperando como máximo y trabajos activos por sesión
+MAX_QUEUED = int(os.environ.get("SMV_MAX_QUEUED", "20"))
+SESSION_MAX_JOBS = int(os.environ.get("SMV_SESSION_MAX_JOBS", "2"))
+STAGES = {'report': ['lectura', 'escritura'], 'pdf': ['ratios', 'informe', 'páginas']}
+
+# --- En los procesos del pool ---------------------------------------------------------------------
+
+_progress_queue = _cancel_tokens = None
+
+class JobCancelled(Exception):
+    """Lanzada en el proceso del pool al empezar una etapa de un trabajo ya cancelado"""
+
+def _warm_worker(queue, tokens, model_path):
+    """Inicializador de cada proceso: deja cargadas las dependencias y la plantilla"""
+    global _progress_queue, _cancel_tokens
+    _progress_queue, _cancel_tokens = queue, tokens
+    import utils, pdf_pages
+    from report_layout import load_template
+    try:
+        load_template(model_path)
+    except OSError as e:
+        print(f"⚠️ No se pudo precargar la plantilla {model_path}: {e}")
+    utils.load_ia()
+
+def _run(job_id, kind, args, kwargs, slot, token):
+    from utils import generate_pdf, generate_report
+    def progress(stage):
+        # El gestor borra el token del lugar del trabajo al cancelarlo
+        if _cancel_tokens[slot] != token:
+            raise JobCancelled(job_id)
+        _progress_queue.put((job_id, 'running', stage))
+    progress(None)
+    # Cada trabajo usa un solo proceso: el paralelismo está entre trabajos
+    if kind == 'report':
+        return generate_report(*args, workers=1, progress=progress, **kwargs)
+    if kind == 'pdf':
+        return generate_pdf(*args, workers=1, progress=progress, **kwargs)
+    raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+
+# --- En el proceso de la app ----------------------------------------------------------------------
+
+class JobRejected(RuntimeError):
+    """El trabajo no se admitió (cola llena o demasiados trabajos de la sesión); retry_after en segundos"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class JobManager:
+    """Admisión: a lo sumo workers trabajos en ejecución y max_queued esperando; cada sesión puede tener
+    session_jobs trabajos activos y pedir otra vez un trabajo del mismo tipo devuelve el que ya tiene.
+    Los trabajos en segundo plano (background) solo se admiten si hay un proceso libre."""
+
+    def __init__(self, workers=JOB_WORKERS, model_path="BASE.xlsx", max_queued=MAX_QUEUED,
+                 session_jobs=SESSION_MAX_JOBS):
+        # multiprocessing y concurrent.futures se importan aquí para no sumarlos al arranque de la app
+        import multiprocessing
+        self.workers, self.model_path = workers, os.path.abspath(model_path)
+        self.max_queued, self.session_jobs = max_queued, session_jobs
+        self._context = multiprocessing.get_context("spawn")
+        self._queue = self._context.Queue()
+        # Un lugar por proceso: tokens[lugar] es el token del trabajo que lo ocupa (0 si se canceló)
+        self._tokens = self._context.RawArray('q', workers)
+        self._free_slots, self._next_token = list(range(workers)), 1
+        # RLock: el callback de un trabajo que ya terminó se ejecuta dentro de submit
+        self._lock = threading.RLock()
+        self._jobs = {}
+        self._pending, self._running, self._cancelling = deque(), {}, set()   # _running: id -> lugar
+        self._durations = deque(maxlen=20)
+        self._pool = self._new_pool()
+        threading.Thread(target=self._listen, name="progreso-trabajos", daemon=True).start()
+
+    def _new_pool(self):
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=self._context,
+                                   initializer=_warm_worker, initargs=(self._queue, self._tokens, self.model_path))
+        # Los procesos se crean (y precalientan) ya, no con el primer trabajo
+        for _ in range(self.workers):
+            pool.submit(time.sleep, 0)
+        return pool
+
+    def _listen(self):
+        while True:
+            job_id, state, stage = self._queue.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job and job['state'] in ('queued', 'running'):
+                    job['state'] = state
+                    job['started'] = job['started'] or time.time()
+                    if stage:
+                        job['stage'] = stage
+
+    def retry_after(self):
+        """Segundos estimados hasta que se libere lugar, según la duración de los últimos trabajos"""
+        average = sum(self._durations) / len(self._durations) if self._durations else 30
+        return max(5, math.ceil(average * (len(self._pending) + 1) / self.workers))
+
+    def submit(self, kind, session, *args, background=False, **kwargs):
+        """Encola un trabajo ('report' con los argumentos de generate_report o 'pdf' con los de
+        generate_pdf) de la sesión y devuelve su id. Lanza JobRejected si no se admite."""
+        if kind not in STAGES:
+            raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+        with self._lock:
+            self._expire()
+            active = [j for j in self._jobs.values() if j['session'] == session and j['state'] in ('queued', 'running')]
+            # Un segundo clic no encola otro trabajo igual
+            for j in active:
+                if j['kind'] == kind:
+                    j['background'] = j['background'] and background
+                    return j['id']
+            if len(active) >= self.session_jobs:
+                raise JobRejected(f"Ya tienes {len(active)} trabajos en curso; espera a que terminen.",
+                                  self.retry_after())
+            free = len(self._running) < self.workers
+            if not free and (background or len(self._pending) >= self.max_queued):
+                raise JobRejected("El servidor está ocupado.", self.retry_after())
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                'id': job_id, 'kind': kind, 'session': session, 'state': 'queued', 'stage': None,
+                'stages': STAGES[kind], 'result': None, 'error': None, 'submitted': time.time(),
+                'traceback': None, 'started': None, 'finished': None, 'future': None, 'background': background,
+                'call': (args, kwargs)}
+            self._pending.append(job_id)
+            self._dispatch()
+            return job_id
+
+    def _dispatch(self):
+        """Pasa al pool los trabajos en espera mientras haya procesos libres (con el lock tomado)"""
+        from concurrent.futures.process import BrokenProcessPool
+        while self._pending and len(self._running) < self.workers:
+            job_id = self._pending.popleft()
+            job = self._jobs[job_id]
+            args, kwargs = job.pop('call')
+            slot, token = self._free_slots.pop(), self._next_token
+            self._next_token += 1
+            self._tokens[slot] = token
+            self._running[job_id] = slot
+            try:
+                future = self._pool.submit(_run, job_id, job['kind'], args, kwargs, slot, token)
+            except BrokenProcessPool:
+                # Un proceso murió (p. ej. por memoria): se reemplaza el pool y se reintenta
+                self._pool = self._new_pool()
+                future = self._pool.submit(_run, job_id, job['kind'], args, kwargs, slot, token)
+            job['future'] = future
+            future.add_done_callback(lambda f, job_id=job_id: self._finish(job_id, f))
+
+    def _finish(self, job_id, future):
+        with self._lock:
+            self._expire()
+            self._free_slots.append(self._running.pop(job_id))
+            self._cancelling.discard(job_id)
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job['finished'] = time.time()
+                if job['started']:
+                    self._durations.append(job['finished'] - job['started'])
+                if future.cancelled() or isinstance(future.exception(), JobCancelled):
+                    job['state'] = 'cancelled'
+                elif (e := future.exception()) is not None:
+                    job['state'], job['error'] = 'error', f"{type(e).__name__}: {e}"
+                    job['traceback'] = "".join(traceback.format_exception(e))
+                else:
+                    job['state'], job['result'] = 'done', future.result()
+            self._dispatch()
+
+    def status(self, job_id):
+        """Copia del trabajo sin el resultado (None si no existe), con 'progress' entre 0 y 1 y, para los
+        que esperan, 'position' en la cola y 'cancelling' (trabajos cancelados que aún ocupan un proceso)"""
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            info = {k: v for k, v in job.items() if k not in ('result', 'future', 'call')}
+            done = job['stages'].index(job['stage']) if job['stage'] in job['stages'] else 0
+            info['progress'] = 1.0 if job['state'] == 'done' else done / len(job['stages'])
+            if job_id in self._pending:
+                info['position'] = self._pending.index(job_id) + 1
+            elif job['state'] == 'queued':
+                info['position'] = 0
+            if job['state'] == 'queued':
+                info['cancelling'] = len(self._cancelling)
+            return info
+
+    def load(self):
+        """{'running', 'cancelling', 'queued', 'workers', 'max_queued'} para mostrar la carga actual;
+        running incluye los cancelados que todavía no llegaron a su siguiente etapa (cancelling)"""
+        with self._lock:
+            return {'running': len(self._running), 'cancelling': len(self._cancelling), 'queued': len(self._pending),
+                    'workers': self.workers, 'max_queued': self.max_queued}
+
+    def result(self, job_id):
+        """Resultado de un trabajo terminado; se quita del registro"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['state'] != 'done':
+                return None
+            del self._jobs[job_id]
+            return job['result']
+
+    def cancel(self, job_id):
+        """Cancela el trabajo; si ya está en ejecución, se detiene al empezar su siguiente etapa y hasta
+        entonces sigue ocupando su proceso (se informa como cancelling)"""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job_id in self._pending:
+                self._pending.remove(job_id)
+            elif job_id in self._running:
+                self._tokens[self._running[job_id]] = 0
+                self._cancelling.add(job_id)
+        if job and job['future'] is not None:
+            job['future'].cancel()
+
+    def cancel_session(self, session):
+        with self._lock:
+            ids = [j['id'] for j in self._jobs.values() if j['session'] == session]
+        for job_id in ids:
+            self.cancel(job_id)
+
+    def _expire(self):
+        """Descarta los trabajos terminados hace más de JOB_TTL_MIN (resultados nunca recogidos)"""
+        limit = time.time() - JOB_TTL_MIN * 60
+        for job_id in [j['id'] for j in self._jobs.values() if j['finished'] and j['finished'] < limit]:
+            del self._jobs[job_id]
+
+_manager, _manager_lock = None, threading.Lock()
+
+def get_job_manager(create=True):
+    """Gestor de trabajos compartido por el proceso; la primera llamada arranca y precalienta el pool
+    (con create=False devuelve None si todavía no se creó)"""
+    global _manager
+    with _manager_lock:
+        if _manager is None and create:
+            _manager = JobManager()
+        return _manager
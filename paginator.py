@@ -0,0 +1,64 @@
+"""Paginador de textos narrativos para los PDF: reparte el texto en páginas una sola vez y dibuja cada
+tramo de líneas con el mismo estilo como un único texto de matplotlib.
+
+paginate trabaja en unidades de línea (una línea normal = 1) y no depende de matplotlib: los saltos de
+página dependen solo del texto y de la capacidad de la página. draw_page convierte esas unidades en
+posiciones de la figura; el interlineado de cada bloque se calibra con las métricas reales de la fuente
+para que ningún bloque ocupe más que el alto asignado.
+"""
+import functools, textwrap
+from matplotlib.backends.backend_agg import RendererAgg
+from matplotlib.font_manager import FontProperties
+
+# Glifos más altos y más bajos que suelen aparecer en los informes, para calibrar el interlineado
+_TALL_GLYPHS = "ÁÉÍÓÚÑÜ|()[]{}lpgjy"
+
+def paginate(text, width, lines_per_page, classify, heights=None, first_page_lines=None):
+    """Páginas de text: cada una es una lista de bloques {'style', 'top', 'lines'} con top en unidades de
+    línea desde el borde superior del área de texto. classify(línea) da el estilo de cada línea (p. ej.
+    'heading', 'bullet', 'body'); heights da su alto en unidades (1 por defecto) y una línea vacía
+    ocupa media unidad. first_page_lines es la capacidad de la primera página, si difiere."""
+    heights = heights or {}
+    pages, blocks, used = [], [], 0.0
+    capacity = first_page_lines or lines_per_page
+    block = None
+
+    for paragraph in text.split('\n'):
+        if not paragraph.strip():
+            if blocks or used:
+                used += 0.5
+            block = None
+            continue
+        for line in textwrap.wrap(paragraph, width, break_long_words=False) or [paragraph]:
+            style = classify(line.strip())
+            height = heights.get(style, 1)
+            if used + height > capacity and (blocks or used):
+                pages.append(blocks)
+                blocks, used, block, capacity = [], 0.0, None, lines_per_page
+            if block is None or block['style'] != style:
+                block = {'style': style, 'top': used, 'lines': []}
+                blocks.append(block)
+            block['lines'].append(line.strip())
+            used += height
+
+    pages.append(blocks)
+    return pages
+
+@functools.lru_cache(maxsize=None)
+def _linespacing(pitch_pt, font):
+    """Interlineado de matplotlib con el que una línea de la fuente ocupa a lo sumo pitch_pt puntos"""
+    _, h, d = RendererAgg(1, 1, 72).get_text_width_height_descent(_TALL_GLYPHS, font, ismath=False)
+    return pitch_pt / (h - d)
+
+def draw_page(fig, blocks, top, pitch, styles):
+    """Dibuja en fig una página de paginate. top es la posición (fracción de la figura) de la primera
+    línea, pitch el alto de una unidad de línea en la misma fracción y styles {estilo: {'x', 'height',
+    argumentos de fig.text}}; cada bloque es un solo texto."""
+    pitch_pt = pitch * fig.get_figheight() * 72
+    for block in blocks:
+        style = dict(styles[block['style']])
+        x, height = style.pop('x'), style.pop('height', 1)
+        font = FontProperties(family=style.get('family'), size=style.get('fontsize'),
+                              weight=style.get('fontweight', 'normal'), style=style.get('style', 'normal'))
+        fig.text(x, top - block['top'] * pitch, "\n".join(block['lines']), ha='left', va='top',
+                 linespacing=_linespacing(pitch_pt * height, font), **style)
@@ -0,0 +1,134 @@
+"""Panel de estados financieros en un único arreglo float64 (empresas × años × líneas).
+
+Las líneas siguen la disposición de BASE.xlsx: primero las filas del estado de situación financiera,
+luego las del estado de resultados y las del flujo de efectivo, cada una desde FIRST_ROW. Una celda
+vacía vale 0 y un texto no numérico NaN; un año sin datos para una empresa queda todo en NaN.
+
+Se guarda como <ruta>.npy (el arreglo, que se abre con memmap) y <ruta>.json (empresas y años).
+"""
+import json
+import numpy as np
+from report_layout import STATEMENTS, FIRST_ROW
+
+PANEL_VERSION = 1
+# Texto con el que entries devuelve las celdas no numéricas (NaN), para que el reporte y los ratios las
+# traten como los textos de los libros SMV: error en una celda individual (IFERROR da 0), ignoradas en SUM
+TEXT_CELL = "n.d."
+
+# {clave del estado: slice de sus líneas en el eje de líneas}
+LINES, _start = {}, 0
+for _, _key, _rows_count in STATEMENTS:
+    LINES[_key] = slice(_start, _start + _rows_count)
+    _start += _rows_count
+N_LINES = _start
+
+def line_index(key, row):
+    """Índice en el eje de líneas de la fila row (numeración de BASE.xlsx) del estado key"""
+    lines = LINES[key]
+    index = lines.start + row - FIRST_ROW
+    if not lines.start <= index < lines.stop:
+        raise IndexError(f"La fila {row} está fuera del estado '{key}'")
+    return index
+
+def _number(value):
+    if value is None: return 0.0
+    try: return float(value)
+    except (TypeError, ValueError): return np.nan
+
+def iferror_div(num, den):
+    """num / den con la semántica de IFERROR(num/den,0): 0 si hay texto (NaN) o el divisor es 0"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = num / den
+    return np.where(np.isfinite(num) & np.isfinite(den) & (den != 0), result, 0.0)
+
+def previous_year(panel):
+    """(valores del año anterior, máscara de año anterior con datos) alineados con panel.values;
+    years va del más reciente al más antiguo y solo cuenta como anterior el año year - 1"""
+    values = panel.values
+    present = ~np.isnan(values).all(axis=-1)
+    previous = np.full_like(values, np.nan)
+    previous[:, :-1] = values[:, 1:]
+    prev_present = np.zeros_like(present)
+    prev_present[:, :-1] = present[:, 1:] & (np.diff(panel.years) == -1)
+    return previous, prev_present
+
+class FinancialPanel:
+    """values[empresa, año, línea]; years va del más reciente al más antiguo, como entries"""
+
+    def __init__(self, companies, years, values):
+        self.companies, self.years = list(companies), [int(y) for y in years]
+        self.values = values
+        if values.shape != (len(self.companies), len(self.years), N_LINES):
+            raise ValueError(f"Forma del panel {values.shape} incompatible con "
+                             f"({len(self.companies)}, {len(self.years)}, {N_LINES})")
+
+    @classmethod
+    def from_entries(cls, entries_by_company):
+        """Construye el panel a partir de {empresa: entries} tal como los devuelve read_smv_files"""
+        companies = list(entries_by_company)
+        years = sorted({e['year'] for entries in entries_by_company.values() for e in entries}, reverse=True)
+        year_pos = {y: i for i, y in enumerate(years)}
+        values = np.full((len(companies), len(years), N_LINES), np.nan)
+        for c, company in enumerate(companies):
+            for e in entries_by_company[company]:
+                row = values[c, year_pos[e['year']]]
+                for key, lines in LINES.items():
+                    data = e[key][:lines.stop - lines.start]
+                    row[lines.start:lines.start + len(data)] = [_number(v) for v in data]
+        return cls(companies, years, values)
+
+    def year_order(self, entries):
+        """Posiciones en el eje de años de los años de entries, en su orden"""
+        return [self.years.index(e['year']) for e in entries]
+
+    def __len__(self):
+        return len(self.companies)
+
+    def statement(self, key):
+        """Vista (empresas × años × filas) de un estado"""
+        return self.values[:, :, LINES[key]]
+
+    def line(self, key, row):
+        """Vista (empresas × años) de una fila de un estado"""
+        return self.values[:, :, line_index(key, row)]
+
+    def present(self):
+        """Máscara (empresas × años) de los años con datos"""
+        return ~np.isnan(self.values).all(axis=-1)
+
+    def company_years(self, company):
+        """Años con datos de la empresa, del más reciente al más antiguo"""
+        present = self.present()[self.companies.index(company)]
+        return [y for y, p in zip(self.years, present) if p]
+
+    def entries(self, company):
+        """entries de la empresa (año más reciente primero); las celdas de texto (NaN) vuelven como TEXT_CELL"""
+        c = self.companies.index(company)
+        years = set(self.company_years(company))
+        result = []
+        for i, y in enumerate(self.years):
+            if y in years:
+                row = self.values[c, i]
+                entry = {'year': y}
+                for key, lines in LINES.items():
+                    entry[key] = [TEXT_CELL if v != v else v for v in row[lines].tolist()]
+                result.append(entry)
+        return result
+
+    def save(self, path):
+        """Escribe <path>.npy y <path>.json; devuelve la ruta del .npy"""
+        np.save(f"{path}.npy", np.ascontiguousarray(self.values, dtype=np.float64))
+        with open(f"{path}.json", "w", encoding="utf-8") as fh:
+            json.dump({'version': PANEL_VERSION, 'companies': self.companies, 'years': self.years}, fh,
+                      ensure_ascii=False)
+        return f"{path}.npy"
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """Abre un panel guardado; con mmap_mode el arreglo se lee del disco bajo demanda"""
+        path = path[:-4] if path.endswith(".npy") else path
+        with open(f"{path}.json", encoding="utf-8") as fh:
+            meta = json.load(fh)
+        if meta.get('version') != PANEL_VERSION:
+            raise ValueError(f"Versión de panel no soportada: {meta.get('version')}")
+        return cls(meta['companies'], meta['years'], np.load(f"{path}.npy", mmap_mode=mmap_mode))
@@ -0,0 +1,247 @@
+"""Páginas del PDF de análisis construidas con Figure y FigureCanvasAgg, sin el estado global de pyplot.
+
+Cada página es una tarea (tipo, datos) independiente y picklable: render_pdf las dibuja en los
+procesos de un pool, cada una como un PDF de una página, y las une en orden con pypdf. Sin pool o
+sin pypdf se dibujan una tras otra en este proceso en un solo PdfPages, con el mismo resultado.
+"""
+import io
+import numpy as np
+import matplotlib
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+from matplotlib.ticker import FuncFormatter, PercentFormatter
+from paginator import draw_page, paginate
+
+try:
+    from pypdf import PdfWriter
+    PYPDF_DISPONIBLE = True
+except ImportError:
+    PYPDF_DISPONIBLE = False
+
+# Estilo de las páginas: se aplica una sola vez por proceso, al importar el módulo
+matplotlib.rcParams.update({'font.sans-serif': 'Arial', 'font.size': 9})
+
+LANDSCAPE, PORTRAIT = (11.69, 8.27), (8.27, 11.69)
+
+CHART_GROUPS = [
+    {'title': 'Análisis de Liquidez y Endeudamiento', 'categories': ['Liquidez', 'Endeudamiento']},
+    {'title': 'Análisis de Rentabilidad y Actividad', 'categories': ['Rentabilidad', 'Actividad']},
+]
+
+def new_figure(figsize):
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    fig.patch.set_facecolor('white')
+    return fig
+
+def add_value_labels(ax, rects, values, ttype):
+    """Añade etiquetas de valores optimizadas"""
+    y_min, y_max = ax.get_ylim()
+
+    for rect, v in zip(rects, values):
+        bar_height = rect.get_height()
+
+        if bar_height >= 0:
+            label_y = bar_height + (y_max - y_min) * 0.015
+            va = 'bottom'
+        else:
+            label_y = bar_height - (y_max - y_min) * 0.015
+            va = 'top'
+
+        if ttype == 'pct':
+            label_text = f"{v*100:.1f}%"
+        else:
+            label_text = f"{v:.2f}" if abs(v) < 10 else f"{v:.1f}"
+
+        ax.text(rect.get_x() + rect.get_width()/2, label_y, label_text,
+                ha='center', va=va, fontsize=8, fontweight='medium',
+                color='darkslategray')
+
+def nice_ticks(ax, values, ttype, n_ticks=5):
+    """Optimiza la escala de los ejes"""
+    v_max, v_min = max(values + [0]), min(values + [0])
+
+    if (span := v_max - v_min) == 0:
+        v_max, v_min = v_max + abs(v_max)*0.1 + 0.1, v_min - abs(v_min)*0.1 - 0.1
+        span = v_max - v_min
+
+    margin_top = span * 0.2
+    margin_bottom = span * 0.05
+
+    ax.set_ylim(v_min - margin_bottom, v_max + margin_top)
+
+    ticks = np.linspace(v_min - margin_bottom, v_max + margin_top, n_ticks)
+    ax.set_yticks(ticks)
+
+    if ttype == 'pct':
+        ax.yaxis.set_major_formatter(PercentFormatter(1.0, decimals=1))
+    else:
+        ax.yaxis.set_major_formatter(FuncFormatter(lambda x, pos: f"{x:.1f}" if abs(x) < 10 else f"{x:.0f}"))
+
+def cover_page(company_name, years):
+    """📄 Portada - formato horizontal"""
+    fig = new_figure(LANDSCAPE)
+    fig.text(0.5, 0.65, "ANÁLISIS FINANCIERO INTEGRAL", ha='center',
+            fontsize=26, fontweight='bold', color='darkblue')
+    fig.text(0.5, 0.58, company_name, ha='center',
+            fontsize=20, color='darkslategray', fontweight='medium')
+    fig.text(0.5, 0.50, "Ratios Financieros y Análisis Narrativo", ha='center',
+            fontsize=16, color='gray')
+    fig.text(0.5, 0.38, f"Período de Análisis: {min(years)} - {max(years)}",
+            ha='center', fontsize=15, fontweight='medium')
+    fig.text(0.5, 0.20, "Generado por Analizador Financiero SMV",
+            ha='center', fontsize=12, color='gray')
+    fig.add_artist(Line2D([0.2, 0.8], [0.55, 0.55], color='darkblue', linewidth=2))
+    fig.add_artist(Line2D([0.2, 0.8], [0.35, 0.35], color='darkblue', linewidth=1))
+    return fig
+
+def chart_page(group, ratios_info, years, all_ratios):
+    """📊 Gráficos de los ratios de las categorías del grupo - formato horizontal"""
+    group_ratios = [r for r in ratios_info if r['category'] in group['categories']]
+    # La cuadrícula sale de la cantidad de ratios (4 -> 2×2, 6 -> 2×3), como en peer_page
+    n_rows = min(2, len(group_ratios)) or 1
+    n_cols = max(1, -(-len(group_ratios) // n_rows))
+
+    fig = new_figure(LANDSCAPE)
+    axes = fig.subplots(n_rows, n_cols, squeeze=False)
+    fig.suptitle(group['title'], fontsize=18, y=0.96, fontweight='bold',
+                color='darkblue', ha='center')
+
+    for i, r in enumerate(group_ratios):
+        ax = axes[i // n_cols, i % n_cols]
+
+        # Ratios promediados con el año anterior: el último año no tiene dato
+        if r.get('avg'):
+            x_years = years[:-1]
+            values = all_ratios[r['row']][:-1]
+        else:
+            x_years = years
+            values = all_ratios[r['row']]
+
+        bars = ax.bar(np.arange(len(x_years)), values,
+                     width=0.65, color='#2E86AB', edgecolor='white',
+                     linewidth=1.2, alpha=0.9)
+
+        ax.set_xticks(np.arange(len(x_years)))
+        ax.set_xticklabels([str(y) for y in x_years], fontsize=11, fontweight='medium')
+
+        ax.set_title(r['name'], fontsize=13, fontweight='bold',
+                   color='darkslategray', pad=12)
+
+        nice_ticks(ax, values, r['type'])
+        ax.set_ylabel(r['short'], fontsize=10, color='gray')
+
+        ax.grid(axis='y', linestyle='--', alpha=0.3, color='gray')
+        ax.set_axisbelow(True)
+
+        add_value_labels(ax, bars, values, r['type'])
+
+        ax.spines['top'].set_visible(False)
+        ax.spines['right'].set_visible(False)
+        ax.spines['left'].set_color('lightgray')
+        ax.spines['bottom'].set_color('lightgray')
+
+    # Remover subplots vacíos
+    for i in range(len(group_ratios), n_rows * n_cols):
+        fig.delaxes(axes[i // n_cols, i % n_cols])
+
+    fig.tight_layout(rect=[0.03, 0.03, 0.97, 0.92], pad=1.8, h_pad=2.5, w_pad=1.5)
+    return fig
+
+def peer_page(ratios_info, company_name, years, all_ratios, stats, n_peers):
+    """👥 Posición de la empresa frente al grupo de pares: por ratio y año, el rango intercuartil y la
+    mediana del grupo, el valor de la empresa y su percentil (stats de peers.PeerSet.compare)"""
+    n_rows, n_cols = 2, (len(ratios_info) + 1) // 2
+    fig = new_figure(LANDSCAPE)
+    axes = fig.subplots(n_rows, n_cols, squeeze=False)
+    fig.suptitle(f"Comparación con el Grupo de Pares ({n_peers} empresas)", fontsize=18, y=0.96,
+                 fontweight='bold', color='darkblue', ha='center')
+    x = np.arange(len(years))
+    for i, r in enumerate(ratios_info):
+        ax = axes[i // n_cols, i % n_cols]
+        q1, median, q3 = stats['q1'][i], stats['median'][i], stats['q3'][i]
+        own = np.array(all_ratios[r['row']], dtype=np.float64)
+        if r.get('avg'):
+            own[-1] = np.nan
+        ax.bar(x, q3 - q1, bottom=q1, width=0.6, color='#CFE3EE', edgecolor='#2E86AB', linewidth=0.8,
+               label='Q1–Q3')
+        ax.scatter(x, median, marker='_', s=300, color='#2E86AB', linewidths=2, label='Mediana', zorder=3)
+        ax.scatter(x, own, marker='o', s=30, color='#E07A1F', label=company_name, zorder=4)
+        shown = [v for v in np.concatenate([q1, q3, own]).tolist() if v == v]
+        nice_ticks(ax, shown, r['type'], n_ticks=4)
+        for xi, p in zip(x, stats['percentile'][i].tolist()):
+            if p == p:
+                ax.text(xi, ax.get_ylim()[1], f"P{p:.0f}", ha='center', va='top', fontsize=8,
+                        fontweight='bold', color='darkslategray')
+        ax.set_xticks(x)
+        ax.set_xticklabels([str(y) for y in years], fontsize=8)
+        ax.set_title(r['short'], fontsize=10, fontweight='bold', color='darkslategray', pad=8)
+        ax.tick_params(axis='y', labelsize=7)
+        ax.grid(axis='y', linestyle='--', alpha=0.3, color='gray')
+        ax.set_axisbelow(True)
+        ax.spines['top'].set_visible(False)
+        ax.spines['right'].set_visible(False)
+    for i in range(len(ratios_info), n_rows * n_cols):
+        fig.delaxes(axes[i // n_cols, i % n_cols])
+    handles, labels = axes[0, 0].get_legend_handles_labels()
+    fig.legend(handles, labels, loc='lower center', ncol=3, fontsize=9, frameon=False)
+    fig.tight_layout(rect=[0.02, 0.06, 0.98, 0.92], pad=1.5, h_pad=2.0, w_pad=1.0)
+    return fig
+
+# 📝 Informe narrativo - formato vertical (A4), paginado con paginator
+CARACTERES_POR_LINEA = 85
+ALTURA_LINEA = 0.024
+Y_INICIAL, Y_SIGUIENTES, Y_FINAL = 0.92, 0.95, 0.08
+MARGEN_IZQUIERDO = 0.08
+_TITULOS = ['ANÁLISIS', 'RESUMEN', 'RECOMENDACIONES', 'FORTALEZAS', 'ÁREAS']
+NARRATIVE_STYLES = {
+    'heading': {'x': MARGEN_IZQUIERDO, 'height': 1.2, 'fontsize': 11, 'fontweight': 'bold', 'color': 'darkblue'},
+    'bullet': {'x': MARGEN_IZQUIERDO + 0.03, 'fontsize': 10, 'color': 'black'},
+    'body': {'x': MARGEN_IZQUIERDO, 'fontsize': 10, 'color': 'black'},
+}
+
+def _narrative_style(linea):
+    if linea.endswith(':') or any(word in linea.upper() for word in _TITULOS):
+        return 'heading'
+    return 'bullet' if linea.startswith(('•', '-')) else 'body'
+
+def narrative_layout(informe):
+    """Páginas del informe (bloques de paginator.paginate), calculadas una sola vez"""
+    return paginate(informe, CARACTERES_POR_LINEA, int((Y_SIGUIENTES - Y_FINAL) / ALTURA_LINEA), _narrative_style,
+                    {k: v.get('height', 1) for k, v in NARRATIVE_STYLES.items()},
+                    first_page_lines=int((Y_INICIAL - Y_FINAL) / ALTURA_LINEA))
+
+def narrative_page(blocks, first):
+    """Una página del informe narrativo (blocks: una página de narrative_layout)"""
+    fig = new_figure(PORTRAIT)
+    if first:
+        fig.text(0.5, 0.96, "ANÁLISIS FINANCIERO NARRATIVO",
+                 ha='center', fontsize=16, fontweight='bold', color='darkblue')
+        fig.add_artist(Line2D([0.1, 0.9], [0.94, 0.94], color='darkblue', linewidth=1))
+    draw_page(fig, blocks, Y_INICIAL if first else Y_SIGUIENTES, ALTURA_LINEA, NARRATIVE_STYLES)
+    return fig
+
+PAGES = {'cover': cover_page, 'charts': chart_page, 'peers': peer_page, 'narrative': narrative_page}
+
+def render_page(kind, args):
+    """Tarea de un proceso del pool: bytes de un PDF con la página (kind, args)"""
+    buffer = io.BytesIO()
+    PAGES[kind](*args).savefig(buffer, format='pdf')
+    return buffer.getvalue()
+
+def render_pdf(pages, pool=None):
+    """Bytes del PDF con las páginas [(kind, args), ...] en orden. Con pool (y pypdf) cada página se
+    dibuja en un proceso y se unen al final; si no, se dibujan aquí en un solo PdfPages."""
+    buffer = io.BytesIO()
+    if pool is not None and PYPDF_DISPONIBLE and len(pages) > 1:
+        writer = PdfWriter()
+        for data in pool.map(render_page, *zip(*pages)):
+            writer.append(io.BytesIO(data))
+        writer.write(buffer)
+    else:
+        with PdfPages(buffer) as pdf:
+            for kind, args in pages:
+                pdf.savefig(PAGES[kind](*args))
+    return buffer.getvalue()
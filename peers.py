@@ -0,0 +1,121 @@
+"""Comparación de una empresa con un grupo de pares: percentil, mediana y cuartiles de cada ratio por año.
+
+Los ratios de todo el grupo se calculan una sola vez con ratios.evaluate al cargarlo (PeerSet) y cada
+comparación es una pasada vectorizada sobre el arreglo ratios × años × pares, sin recorrer los libros.
+
+El grupo por defecto se indica con SMV_PEERS: la ruta de un FinancialPanel guardado (panel.save) o
+'warehouse' para usar todas las empresas del almacén local. Vacío desactiva la página de pares.
+"""
+import os, threading
+import numpy as np
+from panel import FinancialPanel, previous_year
+from ratios import RATIOS, evaluate
+
+PEERS_PATH = os.environ.get("SMV_PEERS", "")
+QUANTILES = (25, 50, 75)
+
+class PeerSet:
+    """values[ratio, año, par] con los ratios de RATIOS (en su orden); NaN donde el par no tiene dato.
+    signature identifica el contenido del origen (peers_signature) o es None si se creó desde un panel."""
+
+    def __init__(self, panel, signature=None):
+        self.signature = signature
+        results = evaluate(panel)
+        # Los ratios promediados no tienen valor en el año sin año anterior (evaluate da 0)
+        _, prev_present = previous_year(panel)
+        self.values = np.stack([np.where(prev_present, results[r['row']], np.nan) if r.get('avg')
+                                else results[r['row']] for r in RATIOS]).transpose(0, 2, 1)
+        self.companies, self.years = list(panel.companies), list(panel.years)
+        self._company_pos = {c: i for i, c in enumerate(self.companies)}
+
+    def __len__(self):
+        return len(self.companies)
+
+    def merge(self, other, signature=None):
+        """PeerSet con las empresas de other agregadas o reemplazando a las de este (sin recalcular las demás)"""
+        keep = [i for i, c in enumerate(self.companies) if c not in other._company_pos]
+        years = sorted(set(self.years) | set(other.years), reverse=True)
+        values = np.full((len(RATIOS), len(years), len(keep) + len(other)), np.nan)
+        values[:, [years.index(y) for y in self.years], :len(keep)] = self.values[:, :, keep]
+        values[:, [years.index(y) for y in other.years], len(keep):] = other.values
+        merged = PeerSet.__new__(PeerSet)
+        merged.values, merged.years, merged.signature = values, years, signature
+        merged.companies = [self.companies[i] for i in keep] + other.companies
+        merged._company_pos = {c: i for i, c in enumerate(merged.companies)}
+        return merged
+
+    def compare(self, company, years, ratios):
+        """Compara los ratios de company ({fila: [valor por año]}, como compute_ratios) en los años years.
+        Devuelve {'percentile', 'q1', 'median', 'q3', 'count'}, cada uno un arreglo ratios × años; la
+        empresa no cuenta entre sus pares y los años que el grupo no tiene quedan en NaN."""
+        y_pos = np.array([self.years.index(y) if y in self.years else -1 for y in years], dtype=int)
+        peers = self.values[:, np.maximum(y_pos, 0)] if len(self.years) else \
+            np.full((len(RATIOS), len(years), 0), np.nan)
+        peers[:, y_pos < 0] = np.nan
+        if company in self._company_pos:
+            peers[:, :, self._company_pos[company]] = np.nan
+        own = np.array([ratios[r['row']] for r in RATIOS], dtype=np.float64)
+        if any(r.get('avg') for r in RATIOS):
+            own[[i for i, r in enumerate(RATIOS) if r.get('avg')], -1] = np.nan
+
+        count = (~np.isnan(peers)).sum(axis=-1)
+        below = (peers < own[..., None]).sum(axis=-1)
+        equal = (peers == own[..., None]).sum(axis=-1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            percentile = np.where((count > 0) & ~np.isnan(own), 100.0 * (below + 0.5 * equal) / count, np.nan)
+        q = np.full((len(QUANTILES),) + count.shape, np.nan)
+        if count.any():
+            with np.errstate(all="ignore"):
+                filled = count > 0
+                q[:, filled] = np.nanpercentile(peers[filled], QUANTILES, axis=-1)
+        return {'percentile': percentile, 'q1': q[0], 'median': q[1], 'q3': q[2], 'count': count}
+
+def _warehouse():
+    from warehouse import get_warehouse
+    warehouse = get_warehouse()
+    if warehouse is None:
+        raise ValueError("El almacén local está desactivado (SMV_WAREHOUSE).")
+    return warehouse
+
+def peers_signature(source):
+    """Firma del contenido de 'warehouse' o de la ruta de un panel guardado: cambia cuando cambian sus datos"""
+    if source == "warehouse":
+        return [source] + _warehouse().signature()
+    path = source[:-4] if source.endswith(".npy") else source
+    return [source] + [[st.st_mtime_ns, st.st_size] for st in map(os.stat, (f"{path}.npy", f"{path}.json"))]
+
+def load_peers(source):
+    """PeerSet a partir de un PeerSet, un FinancialPanel, la ruta de un panel guardado o 'warehouse'"""
+    if isinstance(source, PeerSet):
+        return source
+    if isinstance(source, FinancialPanel):
+        return PeerSet(source)
+    # La firma se toma antes de leer: si los datos cambian durante la lectura, la próxima vez se recargan
+    signature = peers_signature(source)
+    if source == "warehouse":
+        return PeerSet(_warehouse().panel(), signature)
+    return PeerSet(FinancialPanel.load(source), signature)
+
+_peers, _peers_lock = None, threading.Lock()
+
+def get_peers():
+    """Grupo de pares compartido por el proceso según SMV_PEERS (None si no está configurado). Si cambia
+    el contenido del origen, un panel guardado se vuelve a abrir y del almacén solo se leen y calculan
+    las empresas actualizadas desde la última carga"""
+    global _peers
+    if not PEERS_PATH:
+        return None
+    with _peers_lock:
+        signature = peers_signature(PEERS_PATH)
+        if _peers is not None and _peers.signature == signature:
+            return _peers
+        if _peers is not None and PEERS_PATH == "warehouse":
+            warehouse = _warehouse()
+            changed = warehouse.companies(since=_peers.signature[2])
+            if changed:
+                _peers = _peers.merge(PeerSet(warehouse.panel(changed)), signature)
+            else:
+                _peers.signature = signature
+        else:
+            _peers = load_peers(PEERS_PATH)
+        return _peers
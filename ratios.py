@@ -0,0 +1,107 @@
+"""Registro declarativo de ratios: una entrada por ratio, compilada a fórmulas de Excel y a NumPy.
+
+Cada término es (signo, estado, fila inicial[, fila final]) con la numeración de filas de BASE.xlsx.
+Una sola fila se usa como celda (un texto no numérico da error, como en Excel) y un rango con SUM
+(que ignora los textos). Con 'avg' el denominador es el promedio con el año anterior; el año más
+antiguo, que no tiene anterior, vale 0. Todo ratio se envuelve en IFERROR(...,0).
+"""
+import numpy as np
+from openpyxl.utils import get_column_letter
+from panel import FinancialPanel, iferror_div, line_index, previous_year
+from report_layout import STATEMENTS, BASE_COL
+
+RATIOS = [
+    {'row': 4, 'name': 'Liquidez corriente', 'short': 'Liquidez corriente', 'type': 'ratio', 'category': 'Liquidez',
+     'num': [('+', 'bs', 20)], 'den': [('+', 'bs', 55)]},
+    {'row': 5, 'name': 'Prueba ácida', 'short': 'Prueba ácida', 'type': 'ratio', 'category': 'Liquidez',
+     'num': [('+', 'bs', 20), ('-', 'bs', 13)], 'den': [('+', 'bs', 55)]},
+    {'row': 6, 'name': 'Razón de deuda total', 'short': 'Razón deuda total', 'type': 'ratio', 'category': 'Endeudamiento',
+     'num': [('+', 'bs', 69)], 'den': [('+', 'bs', 40)]},
+    {'row': 7, 'name': 'Razón deuda/patrimonio', 'short': 'Razón deuda/patrimonio', 'type': 'ratio', 'category': 'Endeudamiento',
+     'num': [('+', 'bs', 69)], 'den': [('+', 'bs', 78)]},
+    {'row': 8, 'name': 'Margen neto', 'short': 'Margen neto', 'type': 'pct', 'category': 'Rentabilidad',
+     'num': [('+', 'is', 28)], 'den': [('+', 'is', 4)]},
+    {'row': 9, 'name': 'ROA', 'short': 'ROA', 'type': 'pct', 'category': 'Rentabilidad',
+     'num': [('+', 'is', 28)], 'den': [('+', 'bs', 40)]},
+    {'row': 10, 'name': 'ROE', 'short': 'ROE', 'type': 'pct', 'category': 'Rentabilidad',
+     'num': [('+', 'is', 28)], 'den': [('+', 'bs', 78)]},
+    {'row': 11, 'name': 'Rotación de activos totales', 'short': 'Rotación activos', 'type': 'ratio', 'category': 'Actividad',
+     'num': [('+', 'is', 4)], 'den': [('+', 'bs', 40)]},
+    {'row': 12, 'name': 'Rotación de cuentas por cobrar', 'short': 'Rotación CxC', 'type': 'ratio', 'category': 'Actividad',
+     'num': [('+', 'is', 4)], 'den': [('+', 'bs', 8, 11), ('+', 'bs', 24, 27)], 'avg': True},
+    {'row': 13, 'name': 'Rotación de inventarios', 'short': 'Rotación invent.', 'type': 'ratio', 'category': 'Actividad',
+     'num': [('-', 'is', 5)], 'den': [('+', 'bs', 13), ('+', 'bs', 30)], 'avg': True},
+]
+STYLES = {'ratio': 'decimal_style', 'pct': 'percentage_style'}
+_SHEETS = {key: sheet for sheet, key, _ in STATEMENTS}
+
+def _term(term):
+    """(signo, estado, fila inicial, fila final)"""
+    sign, key, first = term[:3]
+    return sign, key, first, term[3] if len(term) > 3 else first
+
+# --- Excel ---
+
+def _excel_term(term, col):
+    sign, key, first, last = _term(term)
+    c = get_column_letter(col)
+    ref = f"'{_SHEETS[key]}'!{c}{first}"
+    return sign, (ref if last == first else f"SUM({ref}:{c}{last})")
+
+def _excel_sum(terms, col, group=False):
+    """Suma de términos; con group se encierra entre paréntesis si tiene más de uno"""
+    text = ""
+    for i, (sign, ref) in enumerate(_excel_term(t, col) for t in terms):
+        text += ("-" if sign == "-" else ("+" if i else "")) + ref
+    return f"({text})" if group and len(terms) > 1 else text
+
+def ratio_formula(ratio, idx, n_years):
+    """Fórmula del ratio para el año en la posición idx (0 si necesita un año anterior que no existe)"""
+    col = BASE_COL + idx
+    num = _excel_sum(ratio['num'], col, group=True)
+    if ratio.get('avg'):
+        if idx >= n_years - 1:
+            return 0
+        den = f"(({_excel_sum(ratio['den'], col)})+({_excel_sum(ratio['den'], col + 1)}))/2"
+        return f"=IFERROR({num}/({den}),0)"
+    return f"=IFERROR({num}/{_excel_sum(ratio['den'], col, group=True)},0)"
+
+def ratio_cells(idx, n_years):
+    """[(fila, fórmula o valor, estilo)] de la hoja RATIOS para el año en la posición idx"""
+    return [(r['row'], ratio_formula(r, idx, n_years), STYLES[r['type']]) for r in RATIOS]
+
+# --- NumPy ---
+
+def _array_sum(values, terms):
+    """Suma de términos sobre values[..., línea]; NaN si una celda individual es texto"""
+    total = 0.0
+    for term in terms:
+        sign, key, first, last = _term(term)
+        if last == first:
+            part = values[..., line_index(key, first)]
+        else:
+            part = np.nansum(values[..., line_index(key, first):line_index(key, last) + 1], axis=-1)
+        total = total - part if sign == "-" else total + part
+    return total
+
+def evaluate(panel):
+    """{fila: arreglo (empresas × años)} con todos los ratios del panel en una pasada por ratio.
+    Los años sin datos de una empresa quedan en NaN."""
+    values, present = panel.values, panel.present()
+    previous, prev_present = previous_year(panel)
+    result = {}
+    for ratio in RATIOS:
+        num = _array_sum(values, ratio['num'])
+        if ratio.get('avg'):
+            den = (_array_sum(values, ratio['den']) + _array_sum(previous, ratio['den'])) / 2
+            value = np.where(prev_present, iferror_div(num, den), 0.0)
+        else:
+            value = iferror_div(num, _array_sum(values, ratio['den']))
+        result[ratio['row']] = np.where(present, value, np.nan)
+    return result
+
+def compute_ratios(entries):
+    """{fila: [valor por año]} para los entries de una empresa (año más reciente primero)"""
+    panel = FinancialPanel.from_entries({None: entries})
+    order = panel.year_order(entries)
+    return {row: values[0, order].tolist() for row, values in evaluate(panel).items()}
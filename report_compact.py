@@ -0,0 +1,72 @@
+"""Modo compacto del reporte: las fórmulas repetidas se reescriben como fórmulas compartidas de Excel.
+
+Cada bloque rectangular de celdas cuya fórmula es la misma desplazada (análisis vertical y horizontal
+de cada hoja, cada fila de RATIOS) guarda el texto una sola vez en la celda superior izquierda; las
+demás solo referencian el bloque (<f t="shared" si="N"/>) y conservan su resultado calculado.
+"""
+import io, re, zipfile
+from xml.sax.saxutils import escape, unescape
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+_FORMULA_CELL = re.compile(rb'<c r="([A-Z]+)([0-9]+)"([^>]*)><f>([^<]*)</f>')
+_SHEET = re.compile(r'xl/worksheets/sheet\d+\.xml')
+_ENTITIES = {"&apos;": "'", "&quot;": '"'}
+# Textos entre comillas (se dejan igual) o referencias A1 fuera de ellos
+_REF = re.compile(r"""'[^']*'|"[^"]*"|(?<![A-Za-z0-9_.$])(\$?)([A-Z]{1,3})(\$?)([0-9]+)(?![A-Za-z0-9_(])""")
+
+def _shape(formula, row, col):
+    """Fórmula en notación relativa R1C1: dos celdas comparten fórmula si tienen la misma forma"""
+    def rel(m):
+        if m.group(2) is None:
+            return m.group(0)
+        c, r = column_index_from_string(m.group(2)), int(m.group(4))
+        return (f"R{r}" if m.group(3) else f"R[{r - row}]") + (f"C{c}" if m.group(1) else f"C[{c - col}]")
+    return _REF.sub(rel, formula)
+
+def _blocks(cells):
+    """Rectángulos [col1, col2, fila1, fila2] de celdas contiguas con la misma forma de fórmula"""
+    runs = []  # tramos de filas consecutivas de una columna: [col, fila1, fila2, forma]
+    for (col, row), formula in sorted(cells.items()):
+        shape = _shape(formula, row, col)
+        if runs and runs[-1][0] == col and runs[-1][2] == row - 1 and runs[-1][3] == shape:
+            runs[-1][2] = row
+        else:
+            runs.append([col, row, row, shape])
+    blocks, open_blocks = [], {}
+    for col, r1, r2, shape in runs:
+        block = open_blocks.get((col - 1, r1, r2, shape))
+        if block:
+            block[1] = col
+        else:
+            block = [col, col, r1, r2]
+            blocks.append(block)
+        open_blocks[(col, r1, r2, shape)] = block
+    return blocks
+
+def share_sheet_formulas(xml):
+    """XML de una hoja con los bloques de fórmulas repetidas convertidos en fórmulas compartidas"""
+    cells = {(column_index_from_string(m.group(1).decode()), int(m.group(2))): unescape(m.group(4).decode(), _ENTITIES)
+             for m in _FORMULA_CELL.finditer(xml)}
+    shared = {}
+    for si, (c1, c2, r1, r2) in enumerate(b for b in _blocks(cells) if b[0] != b[1] or b[2] != b[3]):
+        ref, master = f"{get_column_letter(c1)}{r1}:{get_column_letter(c2)}{r2}", cells[(c1, r1)]
+        for col in range(c1, c2 + 1):
+            for row in range(r1, r2 + 1):
+                shared[(col, row)] = f'<f t="shared" si="{si}"/>'
+        shared[(c1, r1)] = f'<f t="shared" ref="{ref}" si="{si}">{escape(master)}</f>'
+
+    def repl(m):
+        f = shared.get((column_index_from_string(m.group(1).decode()), int(m.group(2))))
+        return m.group(0) if f is None else b'<c r="%s%s"%s>%s' % (m.group(1), m.group(2), m.group(3), f.encode())
+    return _FORMULA_CELL.sub(repl, xml)
+
+def share_formulas(data):
+    """Copia del xlsx (bytes) con fórmulas compartidas en todas sus hojas"""
+    out = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(data)) as src, zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as dst:
+        for item in src.infolist():
+            content = src.read(item)
+            if _SHEET.fullmatch(item.filename):
+                content = share_sheet_formulas(content)
+            dst.writestr(item, content)
+    return out.getvalue()
@@ -0,0 +1,64 @@
+"""Disposición del reporte compartida por los backends de escritura: plantilla, columnas y fórmulas."""
+import os, pickle, threading
+import openpyxl
+from openpyxl.styles import NamedStyle
+from openpyxl.utils import get_column_letter
+
+BS_SHEET, IS_SHEET, CF_SHEET, RATIOS_SHEET = ('ESTADO DE SITUACIÓN FINANCIERA', 'ESTADO DE RESULTADOS',
+                                              'ESTADO DE FLUJO DE EFECTIVO', 'RATIOS')
+# (hoja, clave en entries, filas escritas desde FIRST_ROW)
+STATEMENTS = [(BS_SHEET, 'bs', 77), (IS_SHEET, 'is', 41), (CF_SHEET, 'cf', 75)]
+BASE_COL, FIRST_ROW, RATIOS_COL = 3, 3, 5
+HEADER_COLOR, WHITE, BLACK = "FF337AB6", "FFFFFFFF", "FF000000"
+NAMED_STYLES = [("percentage_style", "0.00%"), ("decimal_style", "0.00")]
+
+# Plantilla BASE.xlsx: se lee una vez por proceso y se guarda serializada; cada reporte recibe
+# una copia independiente y se vuelve a leer si el archivo cambia en disco
+_templates, _templates_lock = {}, threading.Lock()
+
+def template_signature(model_path):
+    stat = os.stat(model_path)
+    return stat.st_mtime_ns, stat.st_size
+
+def load_template(model_path="BASE.xlsx"):
+    """Copia nueva de la plantilla con los estilos con nombre ya registrados"""
+    path = os.path.abspath(model_path)
+    signature = template_signature(path)
+    with _templates_lock:
+        cached = _templates.get(path)
+        if cached is None or cached[0] != signature:
+            wb = openpyxl.load_workbook(path)
+            for style_name, fmt in NAMED_STYLES:
+                try: wb.add_named_style(NamedStyle(name=style_name, number_format=fmt))
+                except ValueError: pass
+            cached = _templates[path] = (signature, pickle.dumps(wb, protocol=pickle.HIGHEST_PROTOCOL))
+            wb.close()
+    return pickle.loads(cached[1])
+
+def analysis_columns(n_years):
+    """Primera columna del análisis vertical y del horizontal"""
+    return BASE_COL + n_years + 2, BASE_COL + 2 * n_years + 4
+
+# Análisis vertical por estado: [(última fila de la sección, fila que actúa como 100%)]; None llega
+# hasta el final del estado y las filas posteriores a la última sección no se analizan
+VERTICAL_SECTIONS = {'bs': [(None, 40)], 'is': [(None, 4)], 'cf': [(24, 24), (52, 52), (72, 72)]}
+
+def vertical_base_row(key, row):
+    """Fila que actúa como 100% en el análisis vertical (None si la fila no se analiza)"""
+    if row <= FIRST_ROW:
+        return None
+    for last, base in VERTICAL_SECTIONS[key]:
+        if last is None or row <= last:
+            return base
+
+def vertical_formula(key, row, col):
+    """La fila base va fija ($) para que la fórmula se pueda copiar hacia abajo (y compartir en modo compacto)"""
+    base_row = vertical_base_row(key, row)
+    if base_row and row != base_row:
+        c = get_column_letter(col)
+        return f"=IFERROR({c}{row}/{c}${base_row},0)"
+
+def horizontal_formula(row, col):
+    """Variación del año de la columna col respecto del año anterior (columna siguiente)"""
+    c, p = get_column_letter(col), get_column_letter(col + 1)
+    return f"=IFERROR(({c}{row}-{p}{row})/{p}{row},0)"
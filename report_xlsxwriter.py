@@ -0,0 +1,244 @@
+"""Backend 'xlsxwriter' del reporte: escritura fila a fila en modo constant_memory.
+
+El contenido y los estilos estáticos de BASE.xlsx se extraen una vez por proceso; cada
+formato distinto se registra una sola vez en el libro y se reutiliza en todas las celdas.
+"""
+import colorsys, os, threading
+import xlsxwriter
+from xlsxwriter.worksheet import Worksheet
+from xml.etree import ElementTree
+from openpyxl.styles.colors import COLOR_INDEX
+from report_layout import (STATEMENTS, RATIOS_SHEET, BASE_COL, FIRST_ROW, RATIOS_COL, HEADER_COLOR, WHITE, BLACK,
+                           NAMED_STYLES, load_template, template_signature, analysis_columns, vertical_formula,
+                           horizontal_formula)
+from analysis import report_analysis
+from ratios import RATIOS, compute_ratios, ratio_cells
+
+_BORDERS = {'thin': 1, 'medium': 2, 'dashed': 3, 'dotted': 4, 'thick': 5, 'double': 6, 'hair': 7, 'mediumDashed': 8,
+            'dashDot': 9, 'mediumDashDot': 10, 'dashDotDot': 11, 'mediumDashDotDot': 12, 'slantDashDot': 13}
+_ALIGN = {'left': 'left', 'center': 'center', 'right': 'right', 'fill': 'fill', 'justify': 'justify',
+          'centerContinuous': 'center_across', 'distributed': 'distributed'}
+_VALIGN = {'top': 'top', 'center': 'vcenter', 'bottom': 'bottom', 'justify': 'vjustify', 'distributed': 'vdistributed'}
+_FONT_KEYS = {'font_name', 'font_size', 'bold', 'italic', 'underline', 'font_strikeout', 'font_color'}
+_NAMED = dict(NAMED_STYLES)
+_A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+
+class _ReportSheet(Worksheet):
+    """Las fórmulas del reporte solo usan IFERROR y SUM: se omite la expansión de funciones
+    dinámicas de xlsxwriter (~30 expresiones regulares por fórmula). _prepare_formula es privado: la versión
+    de xlsxwriter está fijada y test_report_xlsxwriter.py comprueba que se sigue llamando con igual resultado"""
+    def _prepare_formula(self, formula, expand_future_functions=False):
+        return formula[1:] if formula.startswith("=") else formula
+
+def _hex(argb):
+    return "#" + argb[-6:].upper()
+
+def _theme_palette(wb):
+    """Colores del tema en el orden de los índices de SpreadsheetML (lt1, dk1, lt2, dk2, acentos...)"""
+    if not wb.loaded_theme:
+        return []
+    scheme = ElementTree.fromstring(wb.loaded_theme).find(f"{_A}themeElements/{_A}clrScheme")
+    colors = []
+    for node in scheme:
+        clr = node[0]
+        colors.append(clr.get("val") if clr.tag == f"{_A}srgbClr" else clr.get("lastClr", "000000"))
+    if len(colors) >= 4:
+        colors[0], colors[1], colors[2], colors[3] = colors[1], colors[0], colors[3], colors[2]
+    return colors
+
+def _tint(rgb, tint):
+    r, g, b = (int(rgb[i:i + 2], 16) / 255 for i in (0, 2, 4))
+    h, l, s = colorsys.rgb_to_hls(r, g, b)
+    l = l * (1 + tint) if tint < 0 else l * (1 - tint) + tint
+    return "".join(f"{round(v * 255):02X}" for v in colorsys.hls_to_rgb(h, l, s))
+
+def _color(color, palette):
+    """Color de openpyxl (rgb, tema o indexado) en formato '#RRGGBB'"""
+    if color is None:
+        return None
+    if color.type == "rgb" and isinstance(color.rgb, str):
+        return _hex(color.rgb)
+    if color.type == "theme" and color.theme < len(palette):
+        return "#" + _tint(palette[color.theme], color.tint or 0)
+    if color.type == "indexed" and color.indexed < len(COLOR_INDEX):
+        return _hex(COLOR_INDEX[color.indexed])
+
+def _cell_props(cell, palette):
+    """Propiedades de formato de xlsxwriter equivalentes al estilo de una celda de openpyxl"""
+    props = {}
+    f = cell.font
+    for key, value in [('font_name', f.name), ('font_size', f.sz), ('bold', f.b), ('italic', f.i),
+                       ('font_strikeout', f.strike), ('font_color', _color(f.color, palette)),
+                       ('underline', {'single': 1, 'double': 2}.get(f.u))]:
+        if value:
+            props[key] = value
+    if cell.fill.fill_type == "solid" and (bg := _color(cell.fill.fgColor, palette)):
+        props.update(pattern=1, bg_color=bg)
+    for side in ('left', 'right', 'top', 'bottom'):
+        border = getattr(cell.border, side)
+        if border is not None and border.style in _BORDERS:
+            props[side] = _BORDERS[border.style]
+            if color := _color(border.color, palette):
+                props[f"{side}_color"] = color
+    a = cell.alignment
+    for key, value in [('align', _ALIGN.get(a.horizontal)), ('valign', _VALIGN.get(a.vertical)),
+                       ('text_wrap', a.wrap_text), ('indent', int(a.indent or 0)), ('rotation', a.text_rotation)]:
+        if value:
+            props[key] = value
+    if cell.number_format != "General":
+        props['num_format'] = cell.number_format
+    return props
+
+# Contenido estático de la plantilla por ruta, invalidado cuando cambia el archivo
+_layouts, _layouts_lock = {}, threading.Lock()
+
+def template_layout(model_path):
+    """{hoja: {'rows': {fila: {col: [valor, props]}}, 'widths', 'heights', 'merges'}} en el orden del libro"""
+    path = os.path.abspath(model_path)
+    signature = template_signature(path)
+    with _layouts_lock:
+        cached = _layouts.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+    wb = load_template(path)
+    palette, layout = _theme_palette(wb), {}
+    for ws in wb.worksheets:
+        rows = {}
+        for row in ws.iter_rows():
+            for cell in row:
+                if cell.value is not None or cell.has_style:
+                    rows.setdefault(cell.row, {})[cell.column] = [cell.value, _cell_props(cell, palette)]
+        layout[ws.title] = {
+            'rows': rows,
+            'widths': [(d.min, d.max, d.width) for d in ws.column_dimensions.values() if d.customWidth and d.min],
+            'heights': {r: d.height for r, d in ws.row_dimensions.items() if d.height},
+            'merges': [(m.min_row, m.min_col, m.max_row, m.max_col) for m in ws.merged_cells.ranges],
+        }
+    wb.close()
+    with _layouts_lock:
+        _layouts[path] = (signature, layout)
+    return layout
+
+def _header(props):
+    """Relleno azul y fuente blanca en negrita (la fuente se reemplaza completa, como en openpyxl)"""
+    props = {k: v for k, v in props.items() if k not in _FONT_KEYS}
+    props.update(pattern=1, bg_color=_hex(HEADER_COLOR), bold=True, font_color=_hex(WHITE))
+    return props
+
+def _statement_rows(key, rows_count, entries, template_rows):
+    """Genera (fila, {col: [valor, props, resultado]}) en orden ascendente para una hoja de estados financieros;
+    el resultado calculado solo acompaña a las fórmulas"""
+    years = [e['year'] for e in entries]
+    n = len(entries)
+    vert_start, hor_start = analysis_columns(n)
+    thin = {side: 1 for side in ('left', 'right', 'top', 'bottom')}
+    thin.update({f"{side}_color": _hex(BLACK) for side in ('left', 'right', 'top', 'bottom')})
+    vertical, horizontal = report_analysis(entries)[key]
+    last_row = max(list(template_rows) + [FIRST_ROW + max(len(e[key]) for e in entries) - 1])
+    for r in range(1, last_row + 1):
+        cells = {c: [v, dict(p)] for c, (v, p) in template_rows.get(r, {}).items()}
+        for idx, e in enumerate(entries):
+            if FIRST_ROW <= r < FIRST_ROW + len(e[key]):
+                value, props = cells.get(BASE_COL + idx, [None, {}])
+                value = e[key][r - FIRST_ROW]
+                if r != 3 and isinstance(value, (int, float)):
+                    props['num_format'] = "#,##0"
+                if r == FIRST_ROW:
+                    value, props = str(e['year']), _header(props)
+                props.update(thin)
+                cells[BASE_COL + idx] = [value, props]
+        if r == FIRST_ROW - 1:
+            for col, title in [(vert_start, "ANÁLISIS VERTICAL"), (hor_start, "ANÁLISIS HORIZONTAL")]:
+                cells[col] = [title, _header(cells.get(col, [None, {}])[1])]
+        elif r == FIRST_ROW:
+            for start, ys in [(vert_start, years), (hor_start, years[:-1])]:
+                for i, y in enumerate(ys):
+                    props = _header(cells.get(start + i, [None, {}])[1])
+                    props.pop('num_format', None)
+                    cells[start + i] = [str(y), props]
+        elif FIRST_ROW < r < FIRST_ROW + rows_count:
+            for j in range(n):
+                if formula := vertical_formula(key, r, BASE_COL + j):
+                    cells[vert_start + j] = [formula, {'num_format': _NAMED["percentage_style"]},
+                                             float(vertical[j, r - FIRST_ROW])]
+                if j + 1 < n:
+                    cells[hor_start + j] = [horizontal_formula(r, BASE_COL + j), {'num_format': _NAMED["percentage_style"]},
+                                            float(horizontal[j, r - FIRST_ROW])]
+        yield r, cells
+
+def _ratio_rows(entries, template_rows):
+    n = len(entries)
+    overrides, results = {}, compute_ratios(entries)
+    # Nombre de los ratios que la plantilla no rotula
+    for ratio in RATIOS:
+        label, props = template_rows.get(ratio['row'], {}).get(RATIOS_COL - 1, [None, {}])
+        if label is None:
+            overrides.setdefault(ratio['row'], {})[RATIOS_COL - 1] = [ratio['name'], dict(props)]
+    for i, e in enumerate(entries):
+        overrides.setdefault(FIRST_ROW, {})[RATIOS_COL + i] = e['year']
+        for row, value, style in ratio_cells(i, n):
+            cell = [value, {'num_format': _NAMED[style]}]
+            if isinstance(value, str):
+                cell.append(results[row][i])
+            overrides.setdefault(row, {})[RATIOS_COL + i] = cell
+    for r in range(1, max(list(template_rows) + list(overrides)) + 1):
+        cells = {c: [v, dict(p)] for c, (v, p) in template_rows.get(r, {}).items()}
+        for col, value in overrides.get(r, {}).items():
+            if r == FIRST_ROW:
+                props = _header(cells.get(col, [None, {}])[1])
+                props['num_format'] = '0'
+                cells[col] = [value, props]
+            else:
+                cells[col] = value
+        yield r, cells
+
+def write_report_xlsxwriter(model_path, entries, out_file):
+    """Backend 'xlsxwriter': mismas hojas, fórmulas y bloque de RATIOS que el backend openpyxl"""
+    layout = template_layout(model_path)
+    wb = xlsxwriter.Workbook(out_file, {'constant_memory': True, 'strings_to_urls': False,
+                                        'strings_to_numbers': False, 'strings_to_formulas': True})
+    # Los resultados se guardan junto a cada fórmula: no hace falta recalcular el libro al abrirlo
+    wb.calc_on_load = False
+    formats = {}
+    def fmt(props):
+        if not props:
+            return None
+        key = tuple(sorted(props.items()))
+        if key not in formats:
+            formats[key] = wb.add_format(props)
+        return formats[key]
+
+    statements = {sheet: (key, rows_count) for sheet, key, rows_count in STATEMENTS}
+    for sheet_name, sheet in layout.items():
+        ws = wb.add_worksheet(sheet_name, worksheet_class=_ReportSheet)
+        # Los anchos de openpyxl ya incluyen el relleno que set_column añadiría (7 px por carácter)
+        for first, last, width in sheet['widths']:
+            ws.set_column_pixels(first - 1, last - 1, round(width * 7))
+        if sheet_name in statements:
+            rows = _statement_rows(*statements[sheet_name], entries, sheet['rows'])
+            merges = sheet['merges']
+        elif sheet_name == RATIOS_SHEET:
+            rows, merges = _ratio_rows(entries, sheet['rows']), []
+        else:
+            rows, merges = ((r, sheet['rows'][r]) for r in sorted(sheet['rows'])), sheet['merges']
+        # En constant_memory solo se conservan las combinaciones de una fila (las de BASE.xlsx lo son);
+        # una combinación vertical escribiría filas posteriores antes de tiempo
+        merges = [(r1, c1, c2) for r1, c1, r2, c2 in merges if r1 == r2]
+        merged = {(r1, c) for r1, c1, c2 in merges for c in range(c1, c2 + 1)}
+        for r, cells in rows:
+            if r in sheet['heights']:
+                ws.set_row(r - 1, sheet['heights'][r])
+            for c in sorted(cells):
+                if (r, c) in merged:
+                    continue
+                value, props, *result = cells[c]
+                if value is None:
+                    if props: ws.write_blank(r - 1, c - 1, None, fmt(props))
+                else:
+                    ws.write(r - 1, c - 1, value, fmt(props), *result)
+            for r1, c1, c2 in merges:
+                if r1 == r:
+                    value, props = cells.get(c1, [None, {}])[:2]
+                    ws.merge_range(r - 1, c1 - 1, r - 1, c2 - 1, value, fmt(props))
+    wb.close()
+    return out_file
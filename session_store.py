@@ -0,0 +1,169 @@
+"""Almacén de los artefactos de cada sesión de la app (bytes del xlsx y del PDF) con memoria acotada.
+
+Los artefactos se guardan por sesión y nombre. Mientras el total en memoria supera SMV_SESSION_MEMORY_MB,
+los menos usados se vuelcan a archivos en un directorio temporal del proceso y se leen desde ahí al
+descargarlos. Un hilo (janitor) descarta las sesiones sin actividad durante SMV_SESSION_TTL_MIN minutos
+(y cancela sus trabajos en segundo plano), los directorios temporales abandonados por otros procesos y, si
+el disco usado supera SMV_SESSION_DISK_MB, las sesiones menos recientes.
+"""
+import os, shutil, tempfile, threading, time
+from collections import OrderedDict
+
+SESSION_DIR = os.environ.get("SMV_SESSION_DIR", os.path.join(tempfile.gettempdir(), "smv_sessions"))
+SESSION_MEMORY_MB = float(os.environ.get("SMV_SESSION_MEMORY_MB", "256"))
+SESSION_DISK_MB = float(os.environ.get("SMV_SESSION_DISK_MB", "2048"))
+SESSION_TTL_MIN = float(os.environ.get("SMV_SESSION_TTL_MIN", "60"))
+JANITOR_INTERVAL = 60
+
+class SessionStore:
+    def __init__(self, directory=SESSION_DIR, memory_bytes=SESSION_MEMORY_MB * 1024 * 1024,
+                 disk_bytes=SESSION_DISK_MB * 1024 * 1024, ttl=SESSION_TTL_MIN * 60):
+        os.makedirs(directory, exist_ok=True)
+        self.root, self.memory_bytes, self.disk_bytes, self.ttl = directory, memory_bytes, disk_bytes, ttl
+        self.directory = tempfile.mkdtemp(prefix=f"{os.getpid()}-", dir=directory)
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()   # (sesión, nombre) -> bytes, del menos al más usado
+        self._disk = {}                # (sesión, nombre) -> (ruta, tamaño)
+        self._seen = {}                # sesión -> última actividad
+        self._memory_used = 0
+
+    def _path(self, key):
+        session, name = key
+        return os.path.join(self.directory, session, name)
+
+    def put(self, session, name, data):
+        """Guarda (reemplaza) el artefacto name de la sesión"""
+        key = (session, name)
+        with self._lock:
+            self._remove(key)
+            self._memory[key] = bytes(data)
+            self._memory_used += len(data)
+            self._seen[session] = time.time()
+            self._spill()
+
+    def get(self, session, name):
+        """Bytes del artefacto (None si no existe o ya se descartó)"""
+        key = (session, name)
+        with self._lock:
+            self._seen[session] = time.time()
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+            path = self._disk.get(key, (None,))[0]
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as fh:
+                return fh.read()
+        except FileNotFoundError:
+            return None
+
+    def touch(self, session):
+        """Marca actividad de la sesión (la app lo llama en cada ejecución del script)"""
+        with self._lock:
+            self._seen[session] = time.time()
+
+    def drop(self, session, name=None):
+        """Descarta un artefacto o, sin name, todos los de la sesión"""
+        with self._lock:
+            for key in [k for k in list(self._memory) + list(self._disk)
+                        if k[0] == session and (name is None or k[1] == name)]:
+                self._remove(key)
+            if name is None:
+                self._seen.pop(session, None)
+                shutil.rmtree(os.path.join(self.directory, session), ignore_errors=True)
+
+    def _remove(self, key):
+        if key in self._memory:
+            self._memory_used -= len(self._memory.pop(key))
+        if key in self._disk:
+            path, _ = self._disk.pop(key)
+            try: os.remove(path)
+            except FileNotFoundError: pass
+
+    def _spill(self):
+        """Vuelca a disco los artefactos menos usados hasta respetar el presupuesto de memoria"""
+        while self._memory_used > self.memory_bytes and self._memory:
+            key, data = self._memory.popitem(last=False)
+            self._memory_used -= len(data)
+            path = self._path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as fh:
+                    fh.write(data)
+                self._disk[key] = (path, len(data))
+            except OSError as e:
+                print(f"⚠️ No se pudo volcar a disco un archivo de la sesión: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {'sessions': len(self._seen), 'memory_bytes': self._memory_used,
+                    'disk_bytes': sum(size for _, size in self._disk.values())}
+
+    def clean(self):
+        """Una pasada del janitor: sesiones vencidas, directorios abandonados y cuota de disco"""
+        now = time.time()
+        with self._lock:
+            expired = [s for s, seen in self._seen.items() if now - seen > self.ttl]
+        for session in expired:
+            self.drop(session)
+            _cancel_jobs(session)
+
+        # Directorios de procesos que ya no existen (en Windows, o sin pid en el nombre: sin cambios hace más de ttl)
+        for entry in os.scandir(self.root):
+            if entry.path == self.directory or not entry.is_dir():
+                continue
+            pid = entry.name.split("-", 1)[0]
+            try:
+                if pid.isdigit() and os.name != "nt":
+                    stale = not _pid_alive(int(pid))
+                else:
+                    stale = now - entry.stat().st_mtime > self.ttl
+            except FileNotFoundError:
+                continue
+            if stale:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+        with self._lock:
+            used = sum(size for _, size in self._disk.values())
+            oldest_first = sorted(self._seen, key=self._seen.get)
+        for session in oldest_first:
+            if used <= self.disk_bytes:
+                break
+            with self._lock:
+                used -= sum(size for (s, _), (_, size) in self._disk.items() if s == session)
+            self.drop(session)
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _cancel_jobs(session):
+    """Cancela los trabajos de una sesión vencida (p. ej. un PDF anticipado que nadie va a pedir)"""
+    from jobs import get_job_manager
+    if (manager := get_job_manager(create=False)) is not None:
+        manager.cancel_session(session)
+
+def _janitor(store):
+    while True:
+        time.sleep(JANITOR_INTERVAL)
+        try:
+            store.clean()
+        except Exception as e:
+            print(f"⚠️ Error en la limpieza de sesiones: {e}")
+
+_store, _store_lock = None, threading.Lock()
+
+def get_session_store():
+    """Almacén compartido por el proceso; la primera llamada inicia el janitor"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore()
+            threading.Thread(target=_janitor, args=(_store,), name="janitor-sesiones", daemon=True).start()
+        return _store
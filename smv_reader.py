@@ -0,0 +1,171 @@
+"""Lectura en streaming de libros SMV (.xlsx) sin construir el modelo de openpyxl.
+
+Solo se recorre el XML de la primera hoja hasta la última fila necesaria y se
+resuelven únicamente las cadenas compartidas que aparecen en esas celdas.
+"""
+import io, posixpath, re, zipfile
+from xml.etree.ElementTree import iterparse
+
+# Rangos (columna C) leídos de cada libro SMV
+BS_ROWS, IS_ROWS, CF_ROWS = (12, 88), (91, 131), (185, 259)
+DATA_COL = 3
+COMPANY_CELL, YEAR_CELL = (6, 1), (12, 3)   # A6, C12
+YEAR_SCAN = (40, 12)                        # filas/columnas revisadas al buscar el año
+
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+_YEAR_RE = re.compile(r"\b(20\d{2})\b")
+_CELL_RE = re.compile(r"([A-Z]+)(\d+)")
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def _col_index(letters):
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n
+
+def as_file(source):
+    """Acepta rutas, archivos abiertos o bytes (estos últimos se envuelven en un BytesIO)"""
+    return io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
+
+def clean_company_name(value):
+    """Normaliza el valor de A6 ('EMPRESA: X' -> 'X')"""
+    name = str(value or "NOMBRE_DE_LA_EMPRESA").strip()
+    return name.split(':', 1)[1].strip() if name.upper().startswith("EMPRESA:") else name
+
+def _sheets(zf):
+    """Devuelve ([(nombre, ruta_xml)], índice de la hoja activa) en el orden del libro"""
+    rels = {}
+    with zf.open("xl/_rels/workbook.xml.rels") as fh:
+        for _, el in iterparse(fh):
+            if _local(el.tag) == "Relationship":
+                target = el.get("Target", "")
+                rels[el.get("Id")] = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join("xl", target))
+    sheets, active = [], 0
+    with zf.open("xl/workbook.xml") as fh:
+        for _, el in iterparse(fh):
+            tag = _local(el.tag)
+            if tag == "sheet":
+                sheets.append((el.get("name"), rels.get(el.get(_REL_NS))))
+            elif tag == "workbookView":
+                active = int(el.get("activeTab", 0))
+    if not sheets:
+        raise ValueError("El libro no contiene hojas.")
+    return sheets, active if active < len(sheets) else 0
+
+def _iter_cells(zf, path, max_row, max_col=None):
+    """Genera (fila, columna, tipo, valor_crudo) hasta max_row sin cargar la hoja completa"""
+    row = col = 0
+    with zf.open(path) as fh:
+        for event, el in iterparse(fh, events=("start", "end")):
+            tag = _local(el.tag)
+            if event == "start":
+                if tag == "row":
+                    row = int(el.get("r") or row + 1)
+                    col = 0
+                    if row > max_row:
+                        return
+                continue
+            if tag == "c":
+                ref = el.get("r")
+                col = _col_index(_CELL_RE.match(ref).group(1)) if ref else col + 1
+                if max_col is None or col <= max_col:
+                    ctype = el.get("t", "n")
+                    if ctype == "inlineStr":
+                        raw = "".join(_text(n) for n in el if _local(n.tag) == "is")
+                    else:
+                        raw = next((v.text for v in el if _local(v.tag) == "v"), None)
+                    if raw is not None:
+                        yield row, col, ctype, raw
+            elif tag == "row":
+                el.clear()
+
+def _text(node):
+    """Texto de un <si>/<is>: <t> directo o la concatenación de sus <r><t> (sin texto fonético)"""
+    parts = []
+    for child in node:
+        tag = _local(child.tag)
+        if tag == "t":
+            parts.append(child.text or "")
+        elif tag == "r":
+            parts.extend(t.text or "" for t in child if _local(t.tag) == "t")
+    return "".join(parts)
+
+def _shared_strings(zf, indexes):
+    """Lee solo las cadenas compartidas pedidas (se detiene en el mayor índice)"""
+    if not indexes or "xl/sharedStrings.xml" not in zf.namelist():
+        return {}
+    wanted, last, found, i = set(indexes), max(indexes), {}, 0
+    with zf.open("xl/sharedStrings.xml") as fh:
+        for _, el in iterparse(fh):
+            if _local(el.tag) != "si":
+                continue
+            if i in wanted:
+                found[i] = _text(el)
+            el.clear()
+            if i >= last:
+                break
+            i += 1
+    return found
+
+def _cast(ctype, raw, strings):
+    """Convierte el valor crudo igual que openpyxl con data_only=True"""
+    if ctype == "n":
+        return float(raw) if ("." in raw or "E" in raw or "e" in raw) else int(raw)
+    if ctype == "s":
+        return strings.get(int(raw))
+    if ctype == "b":
+        return bool(int(raw))
+    return raw
+
+def _read_cells(zf, path, max_row, wanted):
+    """Lee las celdas (fila, columna) indicadas de una hoja resolviendo cadenas compartidas"""
+    raw = {(r, c): (t, v) for r, c, t, v in _iter_cells(zf, path, max_row, max(c for _, c in wanted))
+           if (r, c) in wanted}
+    strings = _shared_strings(zf, [int(v) for t, v in raw.values() if t == "s"])
+    return {k: _cast(t, v, strings) for k, (t, v) in raw.items()}
+
+def _find_year(zf, sheets):
+    """Equivalente en streaming de utils.find_year_in_workbook"""
+    max_row, max_col = YEAR_SCAN
+    for _, path in sheets:
+        cells = sorted((r, c, t, v) for r, c, t, v in _iter_cells(zf, path, max_row, max_col))
+        strings = _shared_strings(zf, [int(v) for _, _, t, v in cells if t == "s"])
+        for _, _, t, v in cells:
+            value = _cast(t, v, strings)
+            if value and (m := _YEAR_RE.search(str(value))):
+                return int(m.group(1))
+    raise ValueError("No se encontró año en el libro. Asegúrate que el archivo contiene el año (YYYY).")
+
+def _header(zf, sheets, active):
+    """Empresa (A6) y año (C12 o búsqueda en las primeras filas) de la hoja activa"""
+    head = _read_cells(zf, sheets[active][1], YEAR_CELL[0], {COMPANY_CELL, YEAR_CELL})
+    year = head.get(YEAR_CELL) or _find_year(zf, sheets)
+    return clean_company_name(head.get(COMPANY_CELL)), int(str(year).strip())
+
+def probe_smv_file(source):
+    """Lectura mínima para validar una carga: empresa, año y hojas, sin leer los rangos de datos"""
+    with zipfile.ZipFile(as_file(source)) as zf:
+        sheets, active = _sheets(zf)
+        company, year = _header(zf, sheets, active)
+    return {'company': company, 'year': year, 'sheets': [name for name, _ in sheets], 'active': sheets[active][0]}
+
+def read_smv_xml(source):
+    """Motor 'xml': extrae empresa, año y los rangos BS/IS/CF de un libro SMV en streaming"""
+    with zipfile.ZipFile(as_file(source)) as zf:
+        sheets, active = _sheets(zf)
+        first_path, active_path = sheets[0][1], sheets[active][1]
+        ranges = {'bs': BS_ROWS, 'is': IS_ROWS, 'cf': CF_ROWS}
+        wanted = {(r, DATA_COL) for start, end in ranges.values() for r in range(start, end + 1)}
+        if active_path == first_path:
+            cells = _read_cells(zf, first_path, CF_ROWS[1], wanted | {COMPANY_CELL, YEAR_CELL})
+            year = cells.get(YEAR_CELL) or _find_year(zf, sheets)
+            entry = {'company': clean_company_name(cells.get(COMPANY_CELL)), 'year': int(str(year).strip())}
+        else:
+            cells = _read_cells(zf, first_path, CF_ROWS[1], wanted)
+            company, year = _header(zf, sheets, active)
+            entry = {'company': company, 'year': year}
+        for key, (start, end) in ranges.items():
+            entry[key] = [cells.get((r, DATA_COL)) or 0 for r in range(start, end + 1)]
+    return entry
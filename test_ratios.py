@@ -0,0 +1,55 @@
+"""Las fórmulas de Excel de ratios.RATIOS y evaluate() dan lo mismo sobre un panel pequeño.
+
+Las fórmulas se evalúan con un intérprete mínimo que sigue la semántica de Excel que usan: una celda
+con texto da error (y IFERROR, 0), SUM ignora los textos y dividir por 0 es error.
+"""
+import re
+import numpy as np
+import pytest
+from openpyxl.utils import column_index_from_string
+from panel import FinancialPanel, N_LINES, line_index
+from ratios import RATIOS, evaluate, ratio_formula
+from report_layout import BASE_COL, FIRST_ROW, STATEMENTS
+
+_KEYS = {sheet: key for sheet, key, _ in STATEMENTS}
+_RANGE = re.compile(r"SUM\('([^']+)'!([A-Z]+)(\d+):([A-Z]+)(\d+)\)")
+_CELL = re.compile(r"'([^']+)'!([A-Z]+)(\d+)")
+
+def excel_value(formula, entries):
+    """Resultado de una fórmula de ratio_formula con los entries escritos desde BASE_COL, FIRST_ROW"""
+    if not isinstance(formula, str):
+        return formula
+    def cell(sheet, col, row):
+        value = entries[column_index_from_string(col) - BASE_COL][_KEYS[sheet]][int(row) - FIRST_ROW]
+        if isinstance(value, str):
+            raise TypeError(f"#VALUE! ({value})")
+        return value
+    def total(sheet, col, first, last):
+        values = [entries[column_index_from_string(col) - BASE_COL][_KEYS[sheet]][r - FIRST_ROW]
+                  for r in range(int(first), int(last) + 1)]
+        return sum(v for v in values if not isinstance(v, str))
+
+    assert formula.startswith("=IFERROR(") and formula.endswith(",0)")
+    expr = _RANGE.sub(lambda m: f"total({m[1]!r}, {m[2]!r}, {m[3]}, {m[5]})", formula[len("=IFERROR("):-len(",0)")])
+    expr = _CELL.sub(lambda m: f"cell({m[1]!r}, {m[2]!r}, {m[3]})", expr)
+    try:
+        return eval(expr, {'cell': cell, 'total': total})
+    except (TypeError, ZeroDivisionError):
+        return 0
+
+@pytest.fixture
+def panel():
+    rng = np.random.default_rng(0)
+    values = rng.uniform(1, 1000, (1, 3, N_LINES))
+    values[0, 0, line_index('bs', 20)] = np.nan   # texto en una celda individual
+    values[0, 1, line_index('bs', 9)] = np.nan    # texto dentro de un rango de SUM
+    values[0, 2, line_index('bs', 78)] = 0.0      # divisor 0
+    return FinancialPanel(['EMPRESA'], [2024, 2023, 2022], values)
+
+@pytest.mark.parametrize('ratio', RATIOS, ids=[r['short'] for r in RATIOS])
+def test_formula_matches_evaluate(panel, ratio):
+    entries = panel.entries('EMPRESA')
+    expected = evaluate(panel)[ratio['row']][0]
+    for idx in range(len(entries)):
+        formula = ratio_formula(ratio, idx, len(entries))
+        assert excel_value(formula, entries) == pytest.approx(expected[idx], rel=1e-12)
@@ -0,0 +1,37 @@
+"""_ReportSheet reemplaza Worksheet._prepare_formula, un método privado de xlsxwriter (versión fijada en
+requirements.txt): si una actualización deja de llamarlo o cambia lo que escribe, estas pruebas fallan.
+"""
+import io, zipfile
+import xlsxwriter
+from xlsxwriter.worksheet import Worksheet
+from ratios import RATIOS, ratio_formula
+from report_layout import BASE_COL, horizontal_formula, vertical_formula
+from report_xlsxwriter import _ReportSheet
+
+FORMULAS = ([f for r in RATIOS for idx in range(3) if isinstance(f := ratio_formula(r, idx, 3), str)]
+            + [vertical_formula('bs', 10, BASE_COL), horizontal_formula(10, BASE_COL)])
+
+class _CountingSheet(_ReportSheet):
+    calls = 0
+
+    def _prepare_formula(self, formula, expand_future_functions=False):
+        type(self).calls += 1
+        return super()._prepare_formula(formula, expand_future_functions)
+
+def sheet_xml(worksheet_class):
+    buffer = io.BytesIO()
+    wb = xlsxwriter.Workbook(buffer, {'in_memory': True})
+    ws = wb.add_worksheet("Hoja", worksheet_class=worksheet_class)
+    for i, formula in enumerate(FORMULAS):
+        ws.write_formula(i, 0, formula, None, 0.5)
+    wb.close()
+    with zipfile.ZipFile(buffer) as zf:
+        return zf.read("xl/worksheets/sheet1.xml")
+
+def test_hook_is_called():
+    _CountingSheet.calls = 0
+    sheet_xml(_CountingSheet)
+    assert _CountingSheet.calls >= len(FORMULAS)
+
+def test_same_output_as_xlsxwriter():
+    assert sheet_xml(_ReportSheet) == sheet_xml(Worksheet)
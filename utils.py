@@ -1,17 +1,35 @@
-import openpyxl, re, os, numpy as np, matplotlib.pyplot as plt
-from openpyxl.utils import column_index_from_string, get_column_letter
-from openpyxl.styles import NamedStyle, PatternFill, Font, Border, Side
-from matplotlib.backends.backend_pdf import PdfPages 
-from matplotlib.ticker import PercentFormatter
+import openpyxl, io, re, os, sqlite3, threading, multiprocessing, zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from openpyxl.utils import column_index_from_string
+from openpyxl.styles import PatternFill, Font, Border, Side
 from datetime import datetime
-
-# Importación opcional de IA
-try:
-    from informe_ia import generar_informe_ia, exportar_informe_pdf
-    IA_DISPONIBLE = True
-except ImportError:
-    IA_DISPONIBLE = False
-    print("⚠️ Módulo informe_ia no disponible. Se generará PDF sin análisis de IA.")
+from cache import CACHE_DIR, ArtifactCache, DiskCache, sha256_key, sha256_of
+from report_layout import (STATEMENTS, RATIOS_SHEET, BASE_COL, FIRST_ROW, RATIOS_COL, HEADER_COLOR, WHITE, BLACK,
+                           load_template, template_signature, analysis_columns, vertical_formula, horizontal_formula)
+from analysis import report_analysis
+from ratios import RATIOS, compute_ratios, ratio_cells
+from report_xlsxwriter import write_report_xlsxwriter
+from report_compact import share_formulas
+from panel import FinancialPanel
+from warehouse import get_warehouse
+from smv_reader import BS_ROWS, IS_ROWS, CF_ROWS, as_file, clean_company_name, read_smv_xml
+
+# Importación opcional de IA: se hace al generar el primer PDF, no al importar utils (google.genai es pesada)
+_ia, _ia_lock = None, threading.Lock()
+
+def load_ia():
+    """generar_informe_ia o None si el módulo informe_ia no está disponible"""
+    global _ia
+    with _ia_lock:
+        if _ia is None:
+            try:
+                from informe_ia import generar_informe_ia
+                _ia = generar_informe_ia
+            except ImportError:
+                _ia = False
+                print("⚠️ Módulo informe_ia no disponible. Se generará PDF sin análisis de IA.")
+        return _ia or None
 
 def find_year_in_workbook(wb):
     pattern = re.compile(r"\b(20\d{2})\b")
@@ -24,13 +42,138 @@ def find_year_in_workbook(wb):
 
 def find_company_name(wb):
     """Extrae el nombre de la empresa del archivo Excel"""
-    name = str(wb.active['A6'].value or "NOMBRE_DE_LA_EMPRESA").strip()
-    return name.split(':', 1)[1].strip() if name.upper().startswith("EMPRESA:") else name
+    return clean_company_name(wb.active['A6'].value)
 
 def read_range_values(wb, sheet_name, start_row, end_row, col='C'):
     ws = wb[sheet_name] if sheet_name in wb.sheetnames else wb.active
     return [ws.cell(row=r, column=column_index_from_string(col)).value or 0 for r in range(start_row, end_row+1)]
 
+def read_smv_workbook(path):
+    """Motor 'openpyxl': carga el libro completo y extrae empresa, año y rangos BS/IS/CF"""
+    wb = openpyxl.load_workbook(as_file(path), data_only=True)
+    try:
+        first = wb.sheetnames[0]
+        return {'company': find_company_name(wb),
+                'year': int(str(wb.active["C12"].value or find_year_in_workbook(wb)).strip()),
+                'bs': read_range_values(wb, first, *BS_ROWS, 'C'),
+                'is': read_range_values(wb, first, *IS_ROWS, 'C'),
+                'cf': read_range_values(wb, first, *CF_ROWS, 'C')}
+    finally:
+        wb.close()
+
+# Motores de lectura de libros SMV (seleccionable con SMV_ENGINE o el parámetro engine)
+ENGINES = {'openpyxl': read_smv_workbook, 'xml': read_smv_xml}
+DEFAULT_ENGINE = os.environ.get("SMV_ENGINE", "openpyxl")
+
+def read_smv_file(path, engine=None):
+    engine = engine or DEFAULT_ENGINE
+    if engine not in ENGINES:
+        raise ValueError(f"Motor de lectura desconocido: {engine}. Opciones: {', '.join(ENGINES)}")
+    return ENGINES[engine](path)
+
+# Procesos para leer los libros en paralelo (SMV_WORKERS; 1 = secuencial, 0 = núcleos disponibles)
+DEFAULT_WORKERS = int(os.environ.get("SMV_WORKERS", "0")) or os.cpu_count() or 1
+_pools, _pools_lock = {}, threading.Lock()
+
+def get_process_pool(workers):
+    """Pool de procesos compartido por tamaño; se crea una sola vez por proceso"""
+    with _pools_lock:
+        if workers not in _pools:
+            _pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pools[workers]
+
+def _discard_pool(workers):
+    with _pools_lock:
+        pool = _pools.pop(workers, None)
+    if pool:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# Caché de libros ya leídos por hash de contenido, compartida entre procesos (SMV_PARSE_CACHE_MB=0 la desactiva)
+PARSE_SCHEMA_VERSION = 1
+PARSE_CACHE_MB = float(os.environ.get("SMV_PARSE_CACHE_MB", "256"))
+_parse_cache = None
+
+def get_parse_cache():
+    global _parse_cache
+    if _parse_cache is None and PARSE_CACHE_MB > 0:
+        _parse_cache = DiskCache(os.path.join(CACHE_DIR, "parsed"), int(PARSE_CACHE_MB * 1024 * 1024))
+    return _parse_cache
+
+# Caché de artefactos terminados (xlsx, PDF, informe narrativo) por hash de las entradas, la plantilla y la
+# versión del generador (SMV_ARTIFACT_CACHE_MB=0 la desactiva; SMV_ARTIFACT_TTL_H horas sin usar las vence)
+ARTIFACT_VERSION = 1
+ARTIFACT_CACHE_MB = float(os.environ.get("SMV_ARTIFACT_CACHE_MB", "512"))
+ARTIFACT_TTL_H = float(os.environ.get("SMV_ARTIFACT_TTL_H", "168"))
+_artifact_cache = None
+_template_hashes = {}
+
+def get_artifact_cache():
+    global _artifact_cache
+    if _artifact_cache is None and ARTIFACT_CACHE_MB > 0:
+        _artifact_cache = ArtifactCache(os.path.join(CACHE_DIR, "artifacts"), int(ARTIFACT_CACHE_MB * 1024 * 1024),
+                                        ARTIFACT_TTL_H * 3600 or None)
+    return _artifact_cache
+
+def template_hash(model_path):
+    """SHA-256 de la plantilla, recalculado solo si el archivo cambia en disco"""
+    path = os.path.abspath(model_path)
+    signature = template_signature(path)
+    if _template_hashes.get(path, (None,))[0] != signature:
+        _template_hashes[path] = (signature, sha256_of(path))
+    return _template_hashes[path][1]
+
+def _cached_artifact(key, build):
+    """Artefacto de la caché o, si no está, build() guardado en ella"""
+    cache = get_artifact_cache()
+    if cache and (value := cache.get(key)) is not None:
+        return value
+    value = build()
+    if cache:
+        try: cache.put(key, value)
+        except (OSError, TypeError, ValueError) as e: print(f"⚠️ No se pudo guardar en caché: {e}")
+    return value
+
+def _parse_smv_files(input_paths, engine, workers):
+    workers = min(workers or DEFAULT_WORKERS, len(input_paths))
+    if workers <= 1:
+        return [read_smv_file(p, engine) for p in input_paths]
+    try:
+        return list(get_process_pool(workers).map(read_smv_file, input_paths, [engine] * len(input_paths)))
+    except BrokenProcessPool:
+        # Un proceso murió (p. ej. por memoria): se descarta el pool y se reintenta en este proceso
+        _discard_pool(workers)
+        return [read_smv_file(p, engine) for p in input_paths]
+
+def _as_source(source):
+    """Las rutas se mantienen; bytes y archivos abiertos (p. ej. subidas de Streamlit) pasan a bytes"""
+    if isinstance(source, (str, os.PathLike, bytes)):
+        return source
+    if isinstance(source, (bytearray, memoryview)):
+        return bytes(source)
+    if hasattr(source, 'getvalue'):
+        return source.getvalue()
+    source.seek(0)
+    return source.read()
+
+def read_smv_files(input_paths, engine=None, workers=None, use_cache=True):
+    """Lee varios libros SMV (rutas, bytes o archivos abiertos; un libro por tarea en el pool) y devuelve
+    los resultados en el orden recibido. Los libros ya vistos (mismo contenido) se toman de la caché sin abrirlos."""
+    engine = engine or DEFAULT_ENGINE
+    input_paths = [_as_source(p) for p in input_paths]
+    cache = get_parse_cache() if use_cache else None
+    # El motor es parte de la clave: cada motor lee (y se prueba con) el archivo aunque el otro ya lo haya hecho
+    keys = [f"v{PARSE_SCHEMA_VERSION}-{engine}-{sha256_of(p)}" for p in input_paths] if cache else []
+    results = [cache.get(k) for k in keys] if cache else [None] * len(input_paths)
+    missing = [i for i, r in enumerate(results) if r is None]
+    if missing:
+        for i, entry in zip(missing, _parse_smv_files([input_paths[i] for i in missing], engine, workers)):
+            results[i] = entry
+            if cache:
+                try: cache.put(keys[i], entry)
+                # Caché opcional: valores no serializables en JSON (p. ej. fechas de openpyxl) no la usan
+                except (OSError, TypeError, ValueError) as e: print(f"⚠️ No se pudo guardar en caché: {e}")
+    return results
+
 def write_column_into_model(ws, target_start_row, values, col_idx):
     for i, val in enumerate(values):
         r = target_start_row + i
@@ -39,448 +182,375 @@ def write_column_into_model(ws, target_start_row, values, col_idx):
         if r != 3 and isinstance(val, (int, float)):
             cell.number_format = "#,##0"
 
+def clean_filename(empresa):
+    return re.sub(r'[<>:"/\\|?*]', '', empresa)[:50]
+
+def report_filename(empresa, years_sorted):
+    return f"REPORTE_{clean_filename(empresa)}_{years_sorted[-1]}-{years_sorted[0]}.xlsx"
+
 def safe_output_path(output_dir, empresa, years_sorted):
     """Genera un nombre de archivo seguro y único"""
-    empresa_limpia = re.sub(r'[<>:"/\\|?*]', '', empresa)[:50]
-    base = f"REPORTE_{empresa_limpia}_{years_sorted[-1]}-{years_sorted[0]}.xlsx"
-    out_file = os.path.join(output_dir, base)
+    empresa_limpia = clean_filename(empresa)
+    out_file = os.path.join(output_dir, report_filename(empresa, years_sorted))
     if os.path.exists(out_file):
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
         out_file = os.path.join(output_dir, f"REPORTE_{empresa_limpia}_{years_sorted[-1]}-{years_sorted[0]}_{ts}.xlsx")
     return out_file
 
-def process_files_and_generate_report(input_paths, model_path="BASE.xlsx", output_dir="."):
-    model_wb = openpyxl.load_workbook(model_path)
-    
-    # Obtener nombre de la empresa del primer archivo
-    first_wb = openpyxl.load_workbook(input_paths[0], data_only=False)
-    company_name = find_company_name(first_wb)
-    first_wb.close()
-
-    for style_name, fmt in [("percentage_style", "0.00%"), ("decimal_style", "0.00")]:
-        try: model_wb.add_named_style(NamedStyle(name=style_name, number_format=fmt))
-        except: pass
-
-    entries, years = [], []
-    for p in input_paths:
-        wb = openpyxl.load_workbook(p, data_only=True)
-        year = int(str(wb.active["C12"].value or find_year_in_workbook(wb)).strip())
-        years.append(year)
-        entries.append({'year': year, 'bs': read_range_values(wb, wb.sheetnames[0], 12, 88, 'C'),
-                       'is': read_range_values(wb, wb.sheetnames[0], 91, 131, 'C'),
-                       'cf': read_range_values(wb, wb.sheetnames[0], 185, 259, 'C')})
-        wb.close()
+def read_panel(groups, engine=None, workers=None, use_cache=True):
+    """Lee varias empresas (una lista de fuentes por empresa) en un FinancialPanel. Todos los libros
+    se leen en una sola pasada por el pool; el nombre de cada empresa se toma de su primer archivo."""
+    groups = [list(g) for g in groups]
+    parsed = read_smv_files([s for g in groups for s in g], engine, workers, use_cache)
+    by_company, start = {}, 0
+    for g in groups:
+        entries, start = parsed[start:start + len(g)], start + len(g)
+        company_name = entries[0]['company']
+        if company_name in by_company:
+            raise ValueError(f"La empresa {company_name} aparece en más de un grupo de archivos.")
+        by_company[company_name] = [{k: v for k, v in e.items() if k != 'company'} for e in entries]
+    return FinancialPanel.from_entries(by_company)
+
+def panel_company(panel, company=None):
+    """Empresa indicada o, si se omite, la única del panel"""
+    if company is None:
+        if len(panel) != 1:
+            raise ValueError(f"El panel tiene {len(panel)} empresas; indica cuál usar con company.")
+        return panel.companies[0]
+    if company not in panel.companies:
+        raise ValueError(f"La empresa {company} no está en el panel.")
+    return company
+
+def load_report_entries(input_paths, engine=None, workers=None, use_cache=True, company=None):
+    """Lee los libros SMV (o toma una empresa de un FinancialPanel) y valida los años;
+    devuelve (empresa, entries del año más reciente al más antiguo)"""
+    if isinstance(input_paths, FinancialPanel):
+        company_name = panel_company(input_paths, company)
+        entries = input_paths.entries(company_name)
+    else:
+        entries = read_smv_files(input_paths, engine, workers, use_cache)
+        # Nombre de la empresa tomado del primer archivo
+        company_name = entries[0]['company']
+        for e in entries: del e['company']
+    years = [e['year'] for e in entries]
 
     years_sorted = sorted(years, reverse=True)
     if len(set(years)) != len(years): raise ValueError("Años repetidos detectados.")
     for i in range(len(years_sorted)-1):
         if years_sorted[i] - years_sorted[i+1] != 1:
             raise ValueError(f"Los años deben ser consecutivos. Detectados: {', '.join(map(str, years_sorted))}")
-
-    base_col = 3
-    sheets = {'ESTADO DE SITUACIÓN FINANCIERA': 'bs', 'ESTADO DE RESULTADOS': 'is', 'ESTADO DE FLUJO DE EFECTIVO': 'cf'}
-    for idx, e in enumerate(sorted(entries, key=lambda e: e['year'], reverse=True)):
-        for sheet_name, key in sheets.items():
-            write_column_into_model(model_wb[sheet_name], 3, e[key], base_col + idx)
-
+    return company_name, sorted(entries, key=lambda e: e['year'], reverse=True)
+
+def write_report_openpyxl(model_path, entries, out_file):
+    """Backend 'openpyxl': completa una copia de la plantilla en memoria y la guarda"""
+    model_wb = load_template(model_path)
+    years_sorted = [e['year'] for e in entries]
+    header_fill = PatternFill(start_color=HEADER_COLOR, end_color=HEADER_COLOR, fill_type="solid")
+    header_font = Font(color=WHITE, bold=True)
+    thin_black_border = Border(
+        left=Side(style='thin', color=BLACK),
+        right=Side(style='thin', color=BLACK),
+        top=Side(style='thin', color=BLACK),
+        bottom=Side(style='thin', color=BLACK)
+    )
+
+    for idx, e in enumerate(entries):
+        for sheet_name, key, _ in STATEMENTS:
             ws = model_wb[sheet_name]
-            cell = ws.cell(row=3, column=base_col + idx, value=str(e['year']))
-            cell.fill = PatternFill(start_color="FF337AB6", end_color="FF337AB6", fill_type="solid")
-            cell.font = Font(color="FFFFFFFF", bold=True)
-
-            thick_black_border = Border(
-                left=Side(style='thin', color='FF000000'),
-                right=Side(style='thin', color='FF000000'),
-                top=Side(style='thin', color='FF000000'),
-                bottom=Side(style='thin', color='FF000000')
-            )
-            for r in range(3, 3 + len(e[key])):
-                ws.cell(row=r, column=base_col + idx).border = thick_black_border
-
-    def vertical_formula(sheet, row, col, sheet_name):
-        coord = sheet.cell(row=row, column=col).coordinate
-        base_rows = {'ESTADO DE SITUACIÓN FINANCIERA': 40, 'ESTADO DE RESULTADOS': 4}
-        if sheet_name in base_rows:
-            return f"=IFERROR({coord}/{sheet.cell(row=base_rows[sheet_name], column=col).coordinate},0)" if row != base_rows[sheet_name] else None
-        if sheet_name == 'ESTADO DE FLUJO DE EFECTIVO':
-            base_row = 24 if row <= 24 else (52 if row <= 52 else (72 if row <= 72 else None))
-            return f"=IFERROR({coord}/{sheet.cell(row=base_row, column=col).coordinate},0)" if base_row and row != base_row else None
+            write_column_into_model(ws, FIRST_ROW, e[key], BASE_COL + idx)
 
-    n_entries = len(entries)
-    for sheet_name, start_row, rows_count in [('ESTADO DE SITUACIÓN FINANCIERA', 3, 77), 
-                                                ('ESTADO DE RESULTADOS', 3, 41), 
-                                                ('ESTADO DE FLUJO DE EFECTIVO', 3, 75)]:
-        ws = model_wb[sheet_name]
-        vert_start, hor_start = base_col + n_entries + 2, base_col + 2 * n_entries + 4
-        title_fill = PatternFill(start_color="FF337AB6", end_color="FF337AB6", fill_type="solid")
-        title_font = Font(color="FFFFFFFF", bold=True)
-        ws.cell(row=2, column=vert_start, value="ANÁLISIS VERTICAL").fill = title_fill
-        ws.cell(row=2, column=vert_start).font = title_font
-        ws.cell(row=2, column=hor_start, value="ANÁLISIS HORIZONTAL").fill = title_fill
-        ws.cell(row=2, column=hor_start).font = title_font
-
-        header_fill = PatternFill(start_color="FF337AB6", end_color="FF337AB6", fill_type="solid")
-        header_font = Font(color="FFFFFFFF", bold=True)
-        for i, y in enumerate(years_sorted):
-            cell = ws.cell(row=3, column=vert_start+i, value=str(y))
-            cell.number_format = 'General'
+            cell = ws.cell(row=FIRST_ROW, column=BASE_COL + idx, value=str(e['year']))
             cell.fill = header_fill
             cell.font = header_font
-        # Corregir: el análisis horizontal debe mostrar los años correctos (más reciente primero)
-        for i in range(len(years_sorted)-1):
-            cell = ws.cell(row=3, column=hor_start+i, value=str(years_sorted[i]))
-            cell.number_format = 'General'
+            for r in range(FIRST_ROW, FIRST_ROW + len(e[key])):
+                ws.cell(row=r, column=BASE_COL + idx).border = thin_black_border
+
+    n_entries = len(entries)
+    vert_start, hor_start = analysis_columns(n_entries)
+    cached = {}  # {índice de hoja: {celda: resultado de la fórmula}}
+    results = report_analysis(entries)
+    for sheet_name, key, rows_count in STATEMENTS:
+        ws = model_wb[sheet_name]
+        for col, title in [(vert_start, "ANÁLISIS VERTICAL"), (hor_start, "ANÁLISIS HORIZONTAL")]:
+            cell = ws.cell(row=FIRST_ROW - 1, column=col, value=title)
             cell.fill = header_fill
             cell.font = header_font
+
+        # El análisis horizontal muestra los años más recientes primero (el último año no tiene variación)
+        for start, years in [(vert_start, years_sorted), (hor_start, years_sorted[:-1])]:
+            for i, y in enumerate(years):
+                cell = ws.cell(row=FIRST_ROW, column=start + i, value=str(y))
+                cell.number_format = 'General'
+                cell.fill = header_fill
+                cell.font = header_font
         
-        for r in range(start_row+1, start_row+rows_count):
+        values = cached[model_wb.worksheets.index(ws)] = {}
+        vertical, horizontal = results[key]
+        for r in range(FIRST_ROW + 1, FIRST_ROW + rows_count):
             for j in range(n_entries):
-                col_idx = base_col + j
-                if formula := vertical_formula(ws, r, col_idx, sheet_name):
-                    ws.cell(row=r, column=vert_start+j, value=formula).style = "percentage_style"
-                if j+1 < n_entries:
-                    ws.cell(row=r, column=hor_start+j, 
-                           value=f"=IFERROR(({ws.cell(row=r, column=col_idx).coordinate}-{ws.cell(row=r, column=base_col+j+1).coordinate})/{ws.cell(row=r, column=base_col+j+1).coordinate},0)"
-                           ).style = "percentage_style"
-
-    ws_ratios = model_wb['RATIOS']
+                if formula := vertical_formula(key, r, BASE_COL + j):
+                    cell = ws.cell(row=r, column=vert_start + j, value=formula)
+                    cell.style = "percentage_style"
+                    values[cell.coordinate] = vertical[j, r - FIRST_ROW]
+                if j + 1 < n_entries:
+                    cell = ws.cell(row=r, column=hor_start + j, value=horizontal_formula(r, BASE_COL + j))
+                    cell.style = "percentage_style"
+                    values[cell.coordinate] = horizontal[j, r - FIRST_ROW]
+
+    ws_ratios = model_wb[RATIOS_SHEET]
     for merged in list(ws_ratios.merged_cells.ranges): ws_ratios.unmerge_cells(str(merged))
     
-    header_fill = PatternFill(start_color="FF337AB6", end_color="FF337AB6", fill_type="solid")
-    header_font = Font(color="FFFFFFFF", bold=True)
     for i, y in enumerate(years_sorted):
-        cell = ws_ratios.cell(row=3, column=5+i, value=y)
+        cell = ws_ratios.cell(row=FIRST_ROW, column=RATIOS_COL + i, value=y)
         cell.number_format = '0'
         cell.fill = header_fill
         cell.font = header_font 
     
-    for idx in range(len(years_sorted)):
-        col, dc = 5 + idx, get_column_letter(base_col + idx)
-        pc = get_column_letter(base_col + idx + 1) if idx < len(years_sorted) - 1 else dc
-        
-        for row, formula, style in [
-            (4, f"=IFERROR('ESTADO DE SITUACIÓN FINANCIERA'!{dc}20/'ESTADO DE SITUACIÓN FINANCIERA'!{dc}55,0)", "decimal_style"),
-            (5, f"=IFERROR(('ESTADO DE SITUACIÓN FINANCIERA'!{dc}20-'ESTADO DE SITUACIÓN FINANCIERA'!{dc}13)/'ESTADO DE SITUACIÓN FINANCIERA'!{dc}55,0)", "decimal_style"),
-            (6, f"=IFERROR('ESTADO DE SITUACIÓN FINANCIERA'!{dc}69/'ESTADO DE SITUACIÓN FINANCIERA'!{dc}40,0)", "decimal_style"),
-            (7, f"=IFERROR('ESTADO DE SITUACIÓN FINANCIERA'!{dc}69/'ESTADO DE SITUACIÓN FINANCIERA'!{dc}78,0)", "decimal_style"),
-            (8, f"=IFERROR('ESTADO DE RESULTADOS'!{dc}28/'ESTADO DE RESULTADOS'!{dc}4,0)", "percentage_style"),
-            (9, f"=IFERROR('ESTADO DE RESULTADOS'!{dc}28/'ESTADO DE SITUACIÓN FINANCIERA'!{dc}40,0)", "percentage_style"),
-            (10, f"=IFERROR('ESTADO DE RESULTADOS'!{dc}28/'ESTADO DE SITUACIÓN FINANCIERA'!{dc}78,0)", "percentage_style"),
-            (11, f"=IFERROR('ESTADO DE RESULTADOS'!{dc}4/'ESTADO DE SITUACIÓN FINANCIERA'!{dc}40,0)", "decimal_style")
-        ]:
-            ws_ratios.cell(row=row, column=col, value=formula).style = style
-        
-        if idx < len(years_sorted) - 1:
-            ws_ratios.cell(row=12, column=col, value=f"=IFERROR('ESTADO DE RESULTADOS'!{dc}4/((SUM('ESTADO DE SITUACIÓN FINANCIERA'!{dc}8:{dc}11)+SUM('ESTADO DE SITUACIÓN FINANCIERA'!{dc}24:{dc}27)+SUM('ESTADO DE SITUACIÓN FINANCIERA'!{pc}8:{pc}11)+SUM('ESTADO DE SITUACIÓN FINANCIERA'!{pc}24:{pc}27))/2),0)").style = "decimal_style"
-            ws_ratios.cell(row=13, column=col, value=f"=IFERROR(-'ESTADO DE RESULTADOS'!{dc}5/((('ESTADO DE SITUACIÓN FINANCIERA'!{dc}13+'ESTADO DE SITUACIÓN FINANCIERA'!{pc}13)+('ESTADO DE SITUACIÓN FINANCIERA'!{dc}30+'ESTADO DE SITUACIÓN FINANCIERA'!{pc}30))/2),0)").style = "decimal_style"
-        else:
-            for row in [12, 13]: ws_ratios.cell(row=row, column=col, value=0).style = "decimal_style"
-
-    out_file = safe_output_path(output_dir, company_name, years_sorted)
-    model_wb.save(out_file)
+    # Nombre de los ratios que la plantilla no rotula
+    for ratio in RATIOS:
+        if ws_ratios.cell(row=ratio['row'], column=RATIOS_COL - 1).value is None:
+            ws_ratios.cell(row=ratio['row'], column=RATIOS_COL - 1, value=ratio['name'])
+
+    values = cached[model_wb.worksheets.index(ws_ratios)] = {}
+    results = compute_ratios(entries)
+    for idx in range(n_entries):
+        for row, value, style in ratio_cells(idx, n_entries):
+            cell = ws_ratios.cell(row=row, column=RATIOS_COL + idx, value=value)
+            cell.style = style
+            values[cell.coordinate] = results[row][idx]
+
+    # Con los resultados ya guardados no hace falta recalcular todo el libro al abrirlo
+    model_wb.calculation.fullCalcOnLoad = False
+    buffer = io.BytesIO()
+    model_wb.save(buffer)
     model_wb.close()
+    embed_cached_values(buffer.getvalue(), out_file, cached)
+    return out_file
+
+_FORMULA_CELL = re.compile(rb'<c r="([A-Z]+[0-9]+)"([^>]*)><f>([^<]*)</f><v\s*/>')
+
+def embed_cached_values(data, out_file, cached):
+    """Copia el xlsx guardado por openpyxl (que deja vacío el resultado de las fórmulas) añadiendo
+    el valor cached[índice de hoja][celda] a cada fórmula calculada"""
+    def fill(values):
+        def repl(m):
+            value = values.get(m.group(1).decode())
+            if value is None:
+                return m.group(0)
+            return b'<c r="%s"%s><f>%s</f><v>%s</v>' % (m.group(1), m.group(2), m.group(3), repr(float(value)).encode())
+        return repl
+
+    with zipfile.ZipFile(io.BytesIO(data)) as src, zipfile.ZipFile(out_file, "w", zipfile.ZIP_DEFLATED) as dst:
+        for item in src.infolist():
+            content = src.read(item)
+            m = re.fullmatch(r'xl/worksheets/sheet(\d+)\.xml', item.filename)
+            if m and (values := cached.get(int(m.group(1)) - 1)):
+                content = _FORMULA_CELL.sub(fill(values), content)
+            dst.writestr(item, content)
+
+# Backends de escritura del reporte (seleccionable con SMV_REPORT_BACKEND o el parámetro backend)
+BACKENDS = {'openpyxl': write_report_openpyxl, 'xlsxwriter': write_report_xlsxwriter}
+DEFAULT_BACKEND = os.environ.get("SMV_REPORT_BACKEND", "openpyxl")
+# Modo compacto: fórmulas compartidas en lugar de una fórmula completa por celda (SMV_COMPACT_FORMULAS=1)
+DEFAULT_COMPACT = os.environ.get("SMV_COMPACT_FORMULAS", "0").lower() in ("1", "true", "yes")
+
+def generate_report(sources, model_path="BASE.xlsx", engine=None, workers=None, use_cache=True, backend=None,
+                    compact=None, company=None, store=True, progress=None, artifact_cache=True):
+    """Genera el reporte en memoria a partir de rutas, bytes o archivos abiertos, o de la empresa company
+    de un FinancialPanel. Con store, los estados leídos de archivos se guardan en el almacén local (también
+    si el reporte sale de la caché); con use_cache, los libros ya leídos se toman de la caché de lectura y,
+    salvo artifact_cache=False, el mismo conjunto de archivos (en el mismo orden) devuelve el reporte ya generado.
+    progress(etapa), si se indica, se llama al empezar cada etapa ('lectura', 'escritura').
+    Devuelve {'filename', 'data', 'company', 'years', 'entries'} con los bytes del xlsx en 'data'
+    y los estados leídos (año más reciente primero) en 'entries', listos para generate_pdf."""
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de escritura desconocido: {backend}. Opciones: {', '.join(BACKENDS)}")
+    compact = compact if compact is not None else DEFAULT_COMPACT
+    from_files = not isinstance(sources, FinancialPanel)
+    if use_cache and artifact_cache and from_files and get_artifact_cache():
+        sources = [_as_source(s) for s in sources]
+        key = sha256_key('report', ARTIFACT_VERSION, [sha256_of(s) for s in sources], template_hash(model_path),
+                         backend, compact, engine or DEFAULT_ENGINE)
+        report = _cached_artifact(key, lambda: _generate_report(sources, model_path, engine, workers, use_cache,
+                                                                backend, compact, company, progress))
+    else:
+        report = _generate_report(sources, model_path, engine, workers, use_cache, backend, compact, company, progress)
+    if store and from_files and (warehouse := get_warehouse()):
+        try: warehouse.store(report['company'], report['entries'])
+        except (sqlite3.Error, OSError) as e: print(f"⚠️ No se pudo guardar en el almacén: {e}")
+    return report
+
+def _generate_report(sources, model_path, engine, workers, use_cache, backend, compact, company, progress):
+    progress = progress or (lambda stage: None)
+    progress('lectura')
+    company_name, entries = load_report_entries(sources, engine, workers, use_cache, company)
+    years_sorted = [e['year'] for e in entries]
+    progress('escritura')
+    buffer = io.BytesIO()
+    BACKENDS[backend](model_path, entries, buffer)
+    data = buffer.getvalue()
+    if compact:
+        data = share_formulas(data)
+    return {'filename': report_filename(company_name, years_sorted), 'data': data,
+            'company': company_name, 'years': years_sorted, 'entries': entries}
+
+def process_files_and_generate_report(input_paths, model_path="BASE.xlsx", output_dir=".", engine=None, workers=None,
+                                      use_cache=True, backend=None, compact=None, company=None):
+    """Adaptador a disco de generate_report: guarda el reporte en output_dir y devuelve su ruta"""
+    report = generate_report(input_paths, model_path, engine, workers, use_cache, backend, compact, company)
+    return save_report(report, output_dir)
+
+def generate_report_from_store(company, last=None, **kwargs):
+    """Genera el reporte de una empresa ya guardada en el almacén local, sin archivos
+    (last limita a los últimos años guardados)"""
+    warehouse = get_warehouse()
+    if warehouse is None or company not in warehouse.companies():
+        raise ValueError(f"La empresa {company} no está en el almacén local.")
+    years = warehouse.years(company)[:last] if last else None
+    return generate_report(warehouse.panel([company], years), company=company, **kwargs)
+
+def save_report(report, output_dir="."):
+    """Guarda en output_dir el xlsx de un resultado de generate_report y devuelve su ruta"""
+    out_file = safe_output_path(output_dir, report['company'], report['years'])
+    with open(out_file, "wb") as fh:
+        fh.write(report['data'])
     return out_file
 
 def safe_float(x):
     try: return float(x) if x is not None else 0.0
     except: return 0.0
 
-def add_value_labels(ax, rects, values, ttype):
-    """Añade etiquetas de valores optimizadas"""
-    y_min, y_max = ax.get_ylim()
-    
-    for rect, v in zip(rects, values):
-        bar_height = rect.get_height()
-        
-        if bar_height >= 0:
-            label_y = bar_height + (y_max - y_min) * 0.015
-            va = 'bottom'
-        else:
-            label_y = bar_height - (y_max - y_min) * 0.015
-            va = 'top'
-        
-        if ttype == 'pct':
-            label_text = f"{v*100:.1f}%"
-        else:
-            label_text = f"{v:.2f}" if abs(v) < 10 else f"{v:.1f}"
-        
-        ax.text(rect.get_x() + rect.get_width()/2, label_y, label_text,
-                ha='center', va=va, fontsize=8, fontweight='medium', 
-                color='darkslategray')
-
-def nice_ticks(ax, values, ttype, n_ticks=5):
-    """Optimiza la escala de los ejes"""
-    v_max, v_min = max(values + [0]), min(values + [0])
-    
-    if (span := v_max - v_min) == 0:
-        v_max, v_min = v_max + abs(v_max)*0.1 + 0.1, v_min - abs(v_min)*0.1 - 0.1
-        span = v_max - v_min
-    
-    margin_top = span * 0.2
-    margin_bottom = span * 0.05
-    
-    ax.set_ylim(v_min - margin_bottom, v_max + margin_top)
-    
-    ticks = np.linspace(v_min - margin_bottom, v_max + margin_top, n_ticks)
-    ax.set_yticks(ticks)
-    
-    if ttype == 'pct':
-        ax.yaxis.set_major_formatter(PercentFormatter(1.0, decimals=1))
-    else:
-        ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, pos: f"{x:.1f}" if abs(x) < 10 else f"{x:.0f}"))
-
-def generate_ratios_charts_pdf(report_path, output_dir):
-    plt.rcParams.update({'font.sans-serif': 'Arial', 'font.size': 9})
-    
-    wb = openpyxl.load_workbook(report_path, data_only=True)
-    ws_ratios, ws_bs, ws_is = wb['RATIOS'], wb['ESTADO DE SITUACIÓN FINANCIERA'], wb['ESTADO DE RESULTADOS']
-    
-    # Extraer nombre del archivo del reporte
-    import re
-    filename = os.path.basename(report_path)
-    # Extraer nombre entre REPORTE_ y el año
-    match = re.search(r'REPORTE_(.+?)_\d{4}', filename)
-    company_name = match.group(1) if match else find_company_name(wb)
-
-    years, col = [], 5
-    while (v := ws_ratios.cell(row=3, column=col).value):
-        years.append(int(v))
-        col += 1
-    if not years:
+def load_report_data(report_data, report_filename=None):
+    """Respaldo para reportes ya generados: reconstruye {'company', 'years', 'entries'} leyendo el xlsx"""
+    wb = openpyxl.load_workbook(as_file(report_data), data_only=True)
+    try:
+        ws_ratios = wb[RATIOS_SHEET]
+        # Extraer nombre entre REPORTE_ y el año del nombre del reporte
+        match = re.search(r'REPORTE_(.+?)_\d{4}', report_filename or "")
+        company_name = match.group(1) if match else find_company_name(wb)
+
+        years, col = [], RATIOS_COL
+        while (v := ws_ratios.cell(row=FIRST_ROW, column=col).value):
+            years.append(int(v))
+            col += 1
+        if not years:
+            raise ValueError("No se encontraron años en la hoja RATIOS.")
+
+        entries = [{'year': y} for y in years]
+        for sheet_name, key, rows_count in STATEMENTS:
+            ws = wb[sheet_name]
+            for i, e in enumerate(entries):
+                e[key] = [ws.cell(row=r, column=BASE_COL + i).value for r in range(FIRST_ROW, FIRST_ROW + rows_count)]
+        return {'company': company_name, 'years': years, 'entries': entries}
+    finally:
         wb.close()
-        raise ValueError("No se encontraron años en la hoja RATIOS.")
-
-    ratios_info = [
-        {'row': 4, 'name': 'Liquidez corriente', 'short': 'Liquidez corriente', 'type': 'ratio', 'category': 'Liquidez'},
-        {'row': 5, 'name': 'Prueba ácida', 'short': 'Prueba ácida', 'type': 'ratio', 'category': 'Liquidez'},
-        {'row': 6, 'name': 'Razón de deuda total', 'short': 'Razón deuda total', 'type': 'ratio', 'category': 'Endeudamiento'},
-        {'row': 7, 'name': 'Razón deuda/patrimonio', 'short': 'Razón deuda/patrimonio', 'type': 'ratio', 'category': 'Endeudamiento'},
-        {'row': 8, 'name': 'Margen neto', 'short': 'Margen neto', 'type': 'pct', 'category': 'Rentabilidad'},
-        {'row': 9, 'name': 'ROA', 'short': 'ROA', 'type': 'pct', 'category': 'Rentabilidad'},
-        {'row': 10, 'name': 'ROE', 'short': 'ROE', 'type': 'pct', 'category': 'Rentabilidad'},
-        {'row': 11, 'name': 'Rotación de activos totales', 'short': 'Rotación activos', 'type': 'ratio', 'category': 'Actividad'},
-        {'row': 12, 'name': 'Rotación de cuentas por cobrar', 'short': 'Rotación CxC', 'type': 'ratio', 'category': 'Actividad'},
-        {'row': 13, 'name': 'Rotación de inventarios', 'short': 'Rotación invent.', 'type': 'ratio', 'category': 'Actividad'},
-    ]
-
-    def bs_val(row, col_idx): return safe_float(ws_bs.cell(row=row, column=col_idx).value)
-    def is_val(row, col_idx): return safe_float(ws_is.cell(row=row, column=col_idx).value)
-
-    all_ratios = {r['row']: [] for r in ratios_info}
-
-    for i in range(len(years)):
-        col_idx = 3 + i
-        bs = {k: bs_val(k, col_idx) for k in [20, 55, 13, 30, 69, 40, 78]}
-        is_ = {k: is_val(k, col_idx) for k in [28, 4, 5]}
-
-        for row, calc in [
-            (4, bs[20] / bs[55] if bs[55] else 0),
-            (5, (bs[20] - bs[13]) / bs[55] if bs[55] else 0),
-            (6, bs[69] / bs[40] if bs[40] else 0),
-            (7, bs[69] / bs[78] if bs[78] else 0),
-            (8, is_[28] / is_[4] if is_[4] else 0),
-            (9, is_[28] / bs[40] if bs[40] else 0),
-            (10, is_[28] / bs[78] if bs[78] else 0),
-            (11, is_[4] / bs[40] if bs[40] else 0)
-        ]:
-            all_ratios[row].append(calc)
-
-        if i < len(years) - 1:
-            prev_col = col_idx + 1
-            cxc_avg = (sum(bs_val(r, col_idx) for r in list(range(8, 12)) + list(range(24, 28))) + 
-                      sum(bs_val(r, prev_col) for r in list(range(8, 12)) + list(range(24, 28)))) / 2
-            all_ratios[12].append(is_[4] / cxc_avg if cxc_avg else 0)
-            
-            inv_avg = ((bs[13] + bs_val(13, prev_col)) + (bs[30] + bs_val(30, prev_col))) / 2
-            all_ratios[13].append((-is_[5]) / inv_avg if inv_avg else 0)
-        else:
-            all_ratios[12].append(0)
-            all_ratios[13].append(0)
-
-    # 🆕 GENERAR INFORME CON IA 
-    if IA_DISPONIBLE:
-        try:
+
+def generate_pdf(report, report_filename=None, company=None, peers=None, workers=None, progress=None):
+    """Genera el PDF en memoria. report es el resultado de generate_report (usa sus 'entries' sin releer
+    el Excel), un FinancialPanel (con la empresa company) o, como respaldo, un reporte xlsx ya generado
+    (ruta, bytes o archivo abierto). peers agrega la página de comparación con pares (PeerSet,
+    FinancialPanel o ruta; por defecto el grupo de SMV_PEERS, False la omite). Las páginas se dibujan en
+    workers procesos (SMV_WORKERS por defecto; 1 = en este proceso). El PDF y el informe narrativo ya
+    generados con los mismos datos se toman de la caché de artefactos. progress(etapa), si se indica, se
+    llama al empezar cada etapa ('ratios', 'informe', 'páginas').
+    Devuelve {'filename', 'data'} con los bytes del PDF en 'data'."""
+    # Matplotlib y la IA se cargan recién aquí, en la primera generación de un PDF
+    from pdf_pages import CHART_GROUPS, narrative_layout, render_pdf
+    from peers import get_peers, load_peers
+    progress = progress or (lambda stage: None)
+    progress('ratios')
+
+    if isinstance(report, FinancialPanel):
+        company = panel_company(report, company)
+        report = {'company': company, 'years': report.company_years(company), 'entries': report.entries(company)}
+    elif not (isinstance(report, dict) and 'entries' in report):
+        if isinstance(report, dict):
+            report, report_filename = report['data'], report_filename or report.get('filename')
+        report = load_report_data(report, report_filename)
+    company_name, years = report['company'], report['years']
+    ratios_info = RATIOS
+    all_ratios = compute_ratios(report['entries'])
+    # La página de pares es opcional: si el grupo no se puede cargar, el PDF se genera sin ella
+    try:
+        peers = get_peers() if peers is None else (load_peers(peers) if peers is not False else None)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"⚠️ No se pudo cargar el grupo de pares, se omite su página: {e}")
+        peers = None
+
+    # PDF ya generado con los mismos datos, contenido del grupo de pares y versión (no si los pares
+    # se pasan como panel, sin firma de contenido)
+    cache = get_artifact_cache()
+    pdf_key = None
+    if cache and (peers is None or peers.signature is not None):
+        pdf_key = sha256_key('pdf', ARTIFACT_VERSION, company_name, years, report['entries'],
+                             peers.signature if peers is not None else None, bool(load_ia()))
+        if (pdf := cache.get(pdf_key)) is not None:
+            return pdf
+
+    # 🆕 GENERAR INFORME CON IA (el mismo informe se reutiliza para los mismos años y ratios)
+    progress('informe')
+    informe_ia = None
+    if (generar_informe_ia := load_ia()):
+        def informe():
             print("🤖 Generando análisis narrativo con Gemini...")
-            informe_ia = generar_informe_ia(years, all_ratios)
+            texto = generar_informe_ia(years, all_ratios)
+            if not texto or texto.startswith("Error al generar"):
+                raise ValueError(texto or "informe vacío")
             print(f"✅ Análisis generado exitosamente")
+            return texto
+        try:
+            informe_ia = _cached_artifact(sha256_key('narrative', ARTIFACT_VERSION, years, all_ratios), informe)
         except Exception as e:
             print(f"⚠️ Error al generar informe: {e}")
-            informe_ia = None
     else:
         print("ℹ️ Generando PDF sin análisis de IA")
-        informe_ia = None
 
     # 🔄 GENERAR PDF COMBINADO CON GRÁFICOS E INFORME (FORMATO HORIZONTAL)
-    empresa_limpia = re.sub(r'[<>:"/\\|?*]', '', company_name)[:50]
-    pdf_path = os.path.join(output_dir, f"ANALISIS_FINANCIERO_{empresa_limpia}_{min(years)}-{max(years)}.pdf")
-    
-    with PdfPages(pdf_path) as pdf:
-        # 📄 PÁGINA DE PORTADA - FORMATO HORIZONTAL (11.69 x 8.27)
-        fig = plt.figure(figsize=(11.69, 8.27))
-        fig.patch.set_facecolor('white')
-        
-        fig.text(0.5, 0.65, "ANÁLISIS FINANCIERO INTEGRAL", ha='center', 
-                fontsize=26, fontweight='bold', color='darkblue')
-        fig.text(0.5, 0.58, company_name, ha='center', 
-                fontsize=20, color='darkslategray', fontweight='medium')
-        fig.text(0.5, 0.50, "Ratios Financieros y Análisis Narrativo", ha='center', 
-                fontsize=16, color='gray')
-        
-        fig.text(0.5, 0.38, f"Período de Análisis: {min(years)} - {max(years)}", 
-                ha='center', fontsize=15, fontweight='medium')
-        
-        fig.text(0.5, 0.20, "Generado por Analizador Financiero SMV", 
-                ha='center', fontsize=12, color='gray')
-        
-        fig.add_artist(plt.Line2D([0.2, 0.8], [0.55, 0.55], color='darkblue', linewidth=2))
-        fig.add_artist(plt.Line2D([0.2, 0.8], [0.35, 0.35], color='darkblue', linewidth=1))
-        
-        pdf.savefig(fig)
-        plt.close(fig)
-        
-        # 📊 GRÁFICOS DE RATIOS - FORMATO HORIZONTAL (2 PÁGINAS)
-        grupos_graficos = [
-            {
-                'title': 'Análisis de Liquidez y Endeudamiento', 
-                'categories': ['Liquidez', 'Endeudamiento'], 
-                'layout': (2, 2)
-            },
-            {
-                'title': 'Análisis de Rentabilidad y Actividad', 
-                'categories': ['Rentabilidad', 'Actividad'], 
-                'layout': (2, 3)
-            }
-        ]
-        
-        for group in grupos_graficos:
-            group_ratios = [r for r in ratios_info if r['category'] in group['categories']]
-            n_rows, n_cols = group['layout']
-            
-            # FORMATO HORIZONTAL para gráficos
-            fig, axes = plt.subplots(n_rows, n_cols, figsize=(11.69, 8.27), squeeze=False)
-            fig.patch.set_facecolor('white')
-            
-            fig.suptitle(group['title'], fontsize=18, y=0.96, fontweight='bold', 
-                        color='darkblue', ha='center')
-            
-            for i, r in enumerate(group_ratios):
-                row, col = i // n_cols, i % n_cols
-                ax = axes[row, col]
-                
-                # Ajustar valores para rotación (último año no tiene dato)
-                if r['row'] in [12, 13]:
-                    x_years = years[:-1]
-                    values = all_ratios[r['row']][:-1]
-                else:
-                    x_years = years
-                    values = all_ratios[r['row']]
-                
-                bars = ax.bar(np.arange(len(x_years)), values, 
-                             width=0.65, color='#2E86AB', edgecolor='white', 
-                             linewidth=1.2, alpha=0.9)
-                
-                ax.set_xticks(np.arange(len(x_years)))
-                ax.set_xticklabels([str(y) for y in x_years], fontsize=11, fontweight='medium')
-                
-                ax.set_title(r['name'], fontsize=13, fontweight='bold', 
-                           color='darkslategray', pad=12)
-                
-                nice_ticks(ax, values, r['type'])
-                ax.set_ylabel(r['short'], fontsize=10, color='gray')
-                
-                ax.grid(axis='y', linestyle='--', alpha=0.3, color='gray')
-                ax.set_axisbelow(True)
-                
-                add_value_labels(ax, bars, values, r['type'])
-                
-                ax.spines['top'].set_visible(False)
-                ax.spines['right'].set_visible(False)
-                ax.spines['left'].set_color('lightgray')
-                ax.spines['bottom'].set_color('lightgray')
-            
-            # Remover subplots vacíos
-            for i in range(len(group_ratios), n_rows * n_cols):
-                row, col = i // n_cols, i % n_cols
-                fig.delaxes(axes[row, col])
-            
-            plt.tight_layout(rect=[0.03, 0.03, 0.97, 0.92], 
-                           pad=1.8, h_pad=2.5, w_pad=1.5)
-            
-            pdf.savefig(fig, dpi=300)
-            plt.close(fig)
-        
-        # 📝 INFORME NARRATIVO - FORMATO VERTICAL (8.27 x 11.69)
-        if informe_ia:
-            import textwrap
-            
-            # Parámetros optimizados para A4 vertical
-            caracteres_por_linea = 85
-            lineas_por_pagina = 35
-            y_inicial = 0.92
-            altura_linea = 0.024
-            margen_izquierdo = 0.08
-            
-            fig_info = plt.figure(figsize=(8.27, 11.69))
-            fig_info.patch.set_facecolor('white')
-            
-            fig_info.text(0.5, 0.96, "ANÁLISIS FINANCIERO NARRATIVO", 
-                         ha='center', fontsize=16, fontweight='bold', color='darkblue')
-            fig_info.add_artist(plt.Line2D([0.1, 0.9], [0.94, 0.94], color='darkblue', linewidth=1))
-            
-            y_position = y_inicial
-            lineas_en_pagina = 0
-            
-            lineas = informe_ia.split('\n')
-            
-            for linea in lineas:
-                if not linea.strip():
-                    y_position -= altura_linea * 0.5
-                    lineas_en_pagina += 0.5
-                    continue
-                
-                if len(linea) > caracteres_por_linea:
-                    sub_lineas = textwrap.wrap(linea, caracteres_por_linea, break_long_words=False)
-                else:
-                    sub_lineas = [linea]
-                
-                for sub_linea in sub_lineas:
-                    if lineas_en_pagina >= lineas_por_pagina:
-                        pdf.savefig(fig_info)
-                        plt.close(fig_info)
-                        
-                        fig_info = plt.figure(figsize=(8.27, 11.69))
-                        fig_info.patch.set_facecolor('white')
-                        y_position = 0.95
-                        lineas_en_pagina = 0
-                    
-                    texto_limpio = sub_linea.strip()
-                    
-                    if (texto_limpio.endswith(':') or 
-                        any(word in texto_limpio.upper() for word in ['ANÁLISIS', 'RESUMEN', 'RECOMENDACIONES', 'FORTALEZAS', 'ÁREAS'])):
-                        fig_info.text(margen_izquierdo, y_position, texto_limpio, 
-                                     ha='left', va='top', fontsize=11, fontweight='bold', color='darkblue')
-                        lineas_en_pagina += 1.2 
-                        
-                    elif texto_limpio.startswith('•') or texto_limpio.startswith('-'):
-                        fig_info.text(margen_izquierdo + 0.03, y_position, texto_limpio, 
-                                     ha='left', va='top', fontsize=10, color='black')
-                        lineas_en_pagina += 1
-                        
-                    else:
-                        fig_info.text(margen_izquierdo, y_position, texto_limpio, 
-                                     ha='left', va='top', fontsize=10, color='black')
-                        lineas_en_pagina += 1
-                    
-                    y_position -= altura_linea
-            
-            pdf.savefig(fig_info)
-            plt.close(fig_info)
-
-    wb.close()
-    print(f"✅ PDF generado: {pdf_path}")
+    pdf_filename = f"ANALISIS_FINANCIERO_{clean_filename(company_name)}_{min(years)}-{max(years)}.pdf"
+    progress('páginas')
+    pages = [('cover', (company_name, years))]
+    pages += [('charts', (group, ratios_info, years, all_ratios)) for group in CHART_GROUPS]
+    if peers is not None and len(peers):
+        stats = peers.compare(company_name, years, all_ratios)
+        pages.append(('peers', (ratios_info, company_name, years, all_ratios, stats, len(peers))))
+    if informe_ia:
+        pages += [('narrative', (lines, i == 0)) for i, lines in enumerate(narrative_layout(informe_ia))]
+
+    workers = min(workers or DEFAULT_WORKERS, len(pages))
+    try:
+        data = render_pdf(pages, get_process_pool(workers) if workers > 1 else None)
+    except BrokenProcessPool:
+        _discard_pool(workers)
+        data = render_pdf(pages)
+
+    print(f"✅ PDF generado: {pdf_filename}")
     print(f"   - 1 página de portada (horizontal)")
     print(f"   - 2 páginas de gráficos de ratios (horizontal)")
+    if peers is not None and len(peers):
+        print(f"   - 1 página de comparación con {len(peers)} pares (horizontal)")
     print(f"   - Páginas de análisis narrativo (vertical)")
+    pdf = {'filename': pdf_filename, 'data': data}
+    # Sin el informe (si falló la IA) el PDF no se guarda, para reintentarlo la próxima vez
+    if pdf_key and (informe_ia or not load_ia()):
+        try: cache.put(pdf_key, pdf)
+        except (OSError, TypeError, ValueError) as e: print(f"⚠️ No se pudo guardar en caché: {e}")
+    return pdf
+
+def generate_ratios_charts_pdf(report_path, output_dir, company=None):
+    """Adaptador a disco de generate_pdf: guarda el PDF en output_dir y devuelve su ruta.
+    report_path es la ruta de un reporte xlsx o un FinancialPanel."""
+    if isinstance(report_path, FinancialPanel):
+        pdf = generate_pdf(report_path, company=company)
+    else:
+        pdf = generate_pdf(report_path, os.path.basename(report_path))
+    return save_pdf(pdf, output_dir)
+
+def save_pdf(pdf, output_dir="."):
+    """Guarda en output_dir un resultado de generate_pdf y devuelve su ruta"""
+    pdf_path = os.path.join(output_dir, pdf['filename'])
+    with open(pdf_path, "wb") as fh:
+        fh.write(pdf['data'])
     return pdf_path
 
 def generate_complete_financial_pdf(report_path, output_dir="."):
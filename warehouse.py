@@ -0,0 +1,176 @@
+"""Almacén local (SQLite) de estados leídos y ratios calculados, para consultar y regenerar reportes
+sin volver a subir los archivos.
+
+    statements  (company, year, line) -> value    line: índice fijo del FinancialPanel (panel.LINES)
+    ratios      (company, year, ratio) -> value    ratio: fila de la hoja RATIOS
+    companies   company -> updated
+
+Se llena automáticamente después de cada generate_report (SMV_WAREHOUSE indica el archivo; vacío lo
+desactiva). Cada operación abre su propia conexión, de modo que lo pueden usar varios hilos y procesos.
+"""
+import contextlib, os, sqlite3, threading
+from datetime import datetime
+import numpy as np
+from cache import CACHE_DIR
+from panel import FinancialPanel, N_LINES
+from ratios import RATIOS, evaluate
+
+WAREHOUSE_PATH = os.environ.get("SMV_WAREHOUSE", os.path.join(CACHE_DIR, "warehouse.sqlite"))
+SCHEMA_VERSION = 1
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS statements (company TEXT NOT NULL, year INTEGER NOT NULL, line INTEGER NOT NULL,
+                                       value REAL, PRIMARY KEY (company, year, line)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ratios (company TEXT NOT NULL, year INTEGER NOT NULL, ratio INTEGER NOT NULL,
+                                   value REAL, PRIMARY KEY (company, year, ratio)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ratios_by_year ON ratios (ratio, year);
+CREATE TABLE IF NOT EXISTS companies (company TEXT PRIMARY KEY, updated TEXT NOT NULL);
+"""
+
+def ratio_row(ratio):
+    """Fila de un ratio a partir de su fila, nombre o nombre corto ('ROE', 'Margen neto', 10...)"""
+    if isinstance(ratio, int):
+        return ratio
+    for r in RATIOS:
+        if ratio.strip().lower() in (r['name'].lower(), r['short'].lower()):
+            return r['row']
+    raise ValueError(f"Ratio desconocido: {ratio}")
+
+class Warehouse:
+    def __init__(self, path=WAREHOUSE_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as con:
+            if con.execute("PRAGMA user_version").fetchone()[0] not in (0, SCHEMA_VERSION):
+                raise ValueError(f"El almacén {path} tiene otra versión de esquema.")
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(_SCHEMA)
+            con.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Conexión que confirma la transacción al salir sin error y siempre se cierra"""
+        con = sqlite3.connect(self.path, timeout=30)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def store_panel(self, panel):
+        """Guarda (reemplaza) los años con datos de las empresas del panel. Solo se escriben los años que
+        cambian; sus ratios y los del año siguiente (los promediados usan el año anterior, que puede estar
+        en el almacén aunque no venga en el panel) se recalculan con los estados guardados. Si nada cambia
+        no se escribe nada, ni la fecha de actualización de la empresa."""
+        present = panel.present()
+        with self._connect() as con:
+            stored = self._panel(con, panel.companies, panel.years)
+            changed = {}   # empresa -> años que cambian
+            for c, company in enumerate(panel.companies):
+                for y, year in enumerate(panel.years):
+                    if not present[c, y]:
+                        continue
+                    old = stored.values[stored.companies.index(company), stored.years.index(year)] \
+                        if year in stored.years else None
+                    if old is None or not np.array_equal(old, panel.values[c, y], equal_nan=True):
+                        changed.setdefault(company, set()).add(year)
+            if not changed:
+                return
+
+            statements = [(company, year, line, None if v != v else v)
+                          for company, years in changed.items() for year in years
+                          for line, v in enumerate(panel.values[panel.companies.index(company),
+                                                                panel.years.index(year)].tolist())]
+            con.executemany("INSERT OR REPLACE INTO statements VALUES (?, ?, ?, ?)", statements)
+
+            affected = {company: years | {y + 1 for y in years} for company, years in changed.items()}
+            needed = {y + d for years in affected.values() for y in years for d in (0, -1)}
+            recent = self._panel(con, list(changed), sorted(needed))
+            results, recent_present = evaluate(recent), recent.present()
+            ratios = [(company, year, row, float(values[c, y]))
+                      for c, company in enumerate(recent.companies) for y, year in enumerate(recent.years)
+                      if year in affected[company] and recent_present[c, y] for row, values in results.items()]
+            con.executemany("INSERT OR REPLACE INTO ratios VALUES (?, ?, ?, ?)", ratios)
+            # Con microsegundos: signature cambia con cada store que modifica datos
+            updated = datetime.now().isoformat(timespec="microseconds")
+            con.executemany("INSERT OR REPLACE INTO companies VALUES (?, ?)", [(c, updated) for c in changed])
+
+    def store(self, company, entries):
+        """Guarda los entries de una empresa (resultado de la lectura de sus libros)"""
+        self.store_panel(FinancialPanel.from_entries({company: entries}))
+
+    def companies(self, since=None):
+        """Empresas guardadas; con since, solo las actualizadas después (fecha de signature)"""
+        with self._connect() as con:
+            if since is None:
+                return [c for c, in con.execute("SELECT company FROM companies ORDER BY company")]
+            return [c for c, in con.execute("SELECT company FROM companies WHERE updated > ? ORDER BY company",
+                                            (since,))]
+
+    def signature(self):
+        """(empresas, última actualización): cambia cada vez que se guarda algo en el almacén"""
+        with self._connect() as con:
+            return list(con.execute("SELECT COUNT(*), MAX(updated) FROM companies").fetchone())
+
+    def years(self, company):
+        """Años guardados de la empresa, del más reciente al más antiguo"""
+        with self._connect() as con:
+            return [y for y, in con.execute("SELECT DISTINCT year FROM statements WHERE company = ? "
+                                            "ORDER BY year DESC", (company,))]
+
+    def panel(self, companies=None, years=None):
+        """FinancialPanel con las empresas y años indicados (todos si se omiten)"""
+        companies = list(companies) if companies is not None else self.companies()
+        with self._connect() as con:
+            return self._panel(con, companies, years)
+
+    @staticmethod
+    def _panel(con, companies, years=None):
+        query, params = "SELECT company, year, line, value FROM statements WHERE company IN (%s)" % (
+            ",".join("?" * len(companies))), list(companies)
+        if years is not None:
+            query += " AND year IN (%s)" % ",".join("?" * len(years))
+            params += list(years)
+        rows = con.execute(query, params).fetchall()
+        found = sorted({y for _, y, _, _ in rows}, reverse=True)
+        c_pos, y_pos = {c: i for i, c in enumerate(companies)}, {y: i for i, y in enumerate(found)}
+        values = np.full((len(companies), len(found), N_LINES), np.nan)
+        if rows:
+            company_col, year_col, line_col, value_col = zip(*rows)
+            values[[c_pos[c] for c in company_col], [y_pos[y] for y in year_col], list(line_col)] = \
+                np.array(value_col, dtype=np.float64)
+        return FinancialPanel(companies, found, values)
+
+    def entries(self, company, last=None):
+        """entries de la empresa (año más reciente primero); last limita a los últimos años guardados"""
+        years = self.years(company)[:last] if last else None
+        return self.panel([company], years).entries(company)
+
+    def ratios(self, ratio=None, year=None, company=None, last=None):
+        """Filas {'company', 'year', 'ratio', 'name', 'value'} filtradas, p. ej. ratios('ROE', year=2023)
+        para todas las empresas o ratios(company='X', last=5) para los últimos cinco años de una empresa"""
+        query, params = "SELECT company, year, ratio, value FROM ratios WHERE 1 = 1", []
+        if ratio is not None:
+            query, params = query + " AND ratio = ?", params + [ratio_row(ratio)]
+        if year is not None:
+            query, params = query + " AND year = ?", params + [year]
+        if company is not None:
+            query, params = query + " AND company = ?", params + [company]
+            if last:
+                query, params = query + " AND year IN (SELECT DISTINCT year FROM ratios WHERE company = ? " \
+                                        "ORDER BY year DESC LIMIT ?)", params + [company, last]
+        query += " ORDER BY company, year DESC, ratio"
+        names = {r['row']: r['name'] for r in RATIOS}
+        with self._connect() as con:
+            return [{'company': c, 'year': y, 'ratio': r, 'name': names.get(r), 'value': v}
+                    for c, y, r, v in con.execute(query, params)]
+
+_warehouse, _warehouse_lock = None, threading.Lock()
+
+def get_warehouse():
+    """Almacén compartido por el proceso en WAREHOUSE_PATH (None si está desactivado)"""
+    global _warehouse
+    with _warehouse_lock:
+        if _warehouse is None and WAREHOUSE_PATH:
+            _warehouse = Warehouse(WAREHOUSE_PATH)
+        return _warehouse